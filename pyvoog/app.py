@@ -1,15 +1,23 @@
 
 
-""" A Flask subclass setting up request logging and responding to HTTP
-errors with a JSON payload.
+""" A Flask subclass setting up request logging, deadlines, metrics, load
+shedding, profiling and Server-Timing and responding to HTTP errors with a
+JSON payload.
 """
 
+import time
+
 import flask as fl
 import werkzeug.http
 
 from pyvoog.db import teardown_sessions
 from pyvoog.controller import get_response_tuple
+from pyvoog.deadline import track_request_deadlines
+from pyvoog.load_shedding import shed_load
 from pyvoog.logging import log_requests
+from pyvoog.metrics import track_metrics
+from pyvoog.profiling import profile_requests
+from pyvoog.timing import track_server_timing
 from pyvoog.util import AllowException
 
 class Application(fl.Flask):
@@ -20,12 +28,21 @@ class Application(fl.Flask):
             app = fl.current_app
 
             log_requests(app)
+            track_request_deadlines(app)
+            track_metrics(app)
+            shed_load(app)
+            profile_requests(app)
+            track_server_timing(app)
             app._register_error_handlers()
             app._register_teardown_funcs()
 
             if getattr(self, "__app_post_init__", None):
                 self.__app_post_init__()
 
+    def wsgi_app(self, environ, start_response):
+        environ["pyvoog.received_at"] = time.perf_counter()
+        return super().wsgi_app(environ, start_response)
+
     def _register_error_handlers(self):
 
         """ Register error handlers for all valid 4xx and 5xx HTTP status codes
@@ -9,6 +9,10 @@ import sys
 
 from attrs import define, field
 
+from pyvoog.server_profiles import (
+    PROFILES, TUNING_OPTIONS, WORKER_CLASSES, get_profile_settings, get_tuning_argv
+)
+
 @define
 class Args:
     parser_args: dict = {}
@@ -44,14 +48,27 @@ class Args:
         """ Return the portion of argv separated by `--`. Translate our
         arguments to gunicorn equivalents and append to the former. Note that
         this will parse arguments, if this has not happened alredy.
+
+        The settings of the tuning profile, if any, are prepended, so that
+        both the arguments passed through verbatim and our own tuning
+        arguments override these.
         """
 
         args = self.parsed_args
-        gunicorn_argv = self._rest_of_argv.copy()
+        gunicorn_argv = []
+
+        if profile := getattr(args, "profile", None):
+            gunicorn_argv += get_tuning_argv(get_profile_settings(profile))
+
+        gunicorn_argv += self._rest_of_argv
 
         if args.port:
             gunicorn_argv += ["--bind", f"{args.bind}:{args.port}"]
 
+        gunicorn_argv += get_tuning_argv(
+            {k: getattr(args, k, None) for k in TUNING_OPTIONS}
+        )
+
         return gunicorn_argv
 
     def add_common_argumets(self, **defaults):
@@ -85,6 +102,44 @@ class Args:
             "--hide-sql-params", action="store_true", help="Hide SQL parameters from log entries"
         )
 
+        tuning = parser.add_argument_group("server tuning")
+
+        tuning.add_argument(
+            "--profile", default=defaults.get("profile"), choices=PROFILES,
+            help=(
+                "A tuning profile deriving the worker class and counts from the number of CPUs, "
+                "{} by default".format(defaults.get("profile"))
+            )
+        )
+        tuning.add_argument(
+            "--worker-class", default=defaults.get("worker_class"), choices=WORKER_CLASSES,
+            help="The type of Gunicorn workers"
+        )
+        tuning.add_argument(
+            "-w", "--workers", default=defaults.get("workers"), type=int,
+            help="The number of worker processes"
+        )
+        tuning.add_argument(
+            "--threads", default=defaults.get("threads"), type=int,
+            help="The number of threads per worker (gthread workers only)"
+        )
+        tuning.add_argument(
+            "--keepalive", default=defaults.get("keepalive"), type=int,
+            help="The number of seconds to keep idle client connections open"
+        )
+        tuning.add_argument(
+            "--backlog", default=defaults.get("backlog"), type=int,
+            help="The maximum number of pending connections"
+        )
+        tuning.add_argument(
+            "--max-requests", default=defaults.get("max_requests"), type=int,
+            help="Restart workers after this many requests, 0 to disable"
+        )
+        tuning.add_argument(
+            "--max-requests-jitter", default=defaults.get("max_requests_jitter"), type=int,
+            help="A random number of requests up to this many added to --max-requests per worker"
+        )
+
     @staticmethod
     def _split_command_line():
 
@@ -0,0 +1,156 @@
+
+""" A per-host circuit breaker for failing fast on calls to upstream
+services in trouble.
+"""
+
+import threading
+import time
+
+from collections import deque
+from typing import Callable
+from urllib.parse import urlparse
+
+from attrs import define, field
+
+from pyvoog.exceptions import CircuitOpenError
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+def is_server_error(response):
+    return getattr(response, "status_code", 0) >= 500
+
+@define
+class _Circuit:
+    window: deque
+    state: str = CLOSED
+    opened_at: float = 0
+    probes_in_flight: int = 0
+    generation: int = 0
+    lock: threading.Lock = field(factory=threading.Lock)
+
+@define
+class CircuitBreaker:
+
+    """ Track the outcomes of calls per upstream host over a rolling window
+    of the last `window_size` calls. A call fails if it raises or if
+    `is_failure` returns true for its result (by default, if the result is
+    a response with a HTTP/5xx status); calls lasting longer than
+    `slow_call_threshold` seconds (if set) are also counted as failures.
+
+    Once at least `min_calls` outcomes have been recorded and the share of
+    failures reaches `error_rate_threshold`, the circuit opens and calls to
+    the host fail immediately with a CircuitOpenError for `open_duration`
+    seconds. After that, the circuit is half-open: up to `half_open_probes`
+    concurrent calls are let through, closing the circuit on success and
+    reopening it on failure.
+
+    An instance is meant to be shared, e.g. across all UserAgents of an
+    application.
+    """
+
+    error_rate_threshold: float = 0.5
+    slow_call_threshold: float = None
+    min_calls: int = 10
+    window_size: int = 20
+    open_duration: float = 30
+    half_open_probes: int = 1
+    is_failure: Callable = is_server_error
+    _circuits: dict = field(init=False, factory=dict)
+    _lock: threading.Lock = field(init=False, factory=threading.Lock)
+
+    def call(self, url, fn, *args, **kwargs):
+
+        """ Invoke `fn` with the remaining arguments, guarded by the circuit
+        of the host in `url`.
+        """
+
+        host = urlparse(url).hostname
+        circuit = self._get_circuit(host)
+
+        probe_generation = self._acquire(host, circuit)
+
+        started_at = time.monotonic()
+        failed = True
+
+        try:
+            result = fn(*args, **kwargs)
+            failed = bool(self.is_failure and self.is_failure(result))
+        finally:
+            elapsed = time.monotonic() - started_at
+            is_slow = self.slow_call_threshold is not None and elapsed > self.slow_call_threshold
+
+            self._record(circuit, failed or is_slow, probe_generation)
+
+        return result
+
+    def get_state(self, host):
+        return self._get_circuit(host).state
+
+    def _get_circuit(self, host):
+        with self._lock:
+            if host not in self._circuits:
+                self._circuits[host] = _Circuit(window=deque(maxlen=self.window_size))
+
+            return self._circuits[host]
+
+    def _acquire(self, host, circuit):
+
+        """ Admit a call or raise CircuitOpenError. Return the generation of
+        the circuit if the call is a half-open probe, otherwise None.
+        """
+
+        with circuit.lock:
+            if circuit.state == OPEN and time.monotonic() - circuit.opened_at >= self.open_duration:
+                circuit.state = HALF_OPEN
+
+            if circuit.state == HALF_OPEN and circuit.probes_in_flight < self.half_open_probes:
+                circuit.probes_in_flight += 1
+                return circuit.generation
+            elif circuit.state != CLOSED:
+                raise CircuitOpenError(message=f"Circuit breaker open for {host}")
+
+            return None
+
+    def _record(self, circuit, failed, probe_generation=None):
+        with circuit.lock:
+
+            # Probes outliving the half-open state they were admitted in
+            # (another probe having opened or closed the circuit meanwhile)
+            # hold no slot any more and are recorded as regular calls.
+
+            if probe_generation is not None and probe_generation == circuit.generation:
+                circuit.probes_in_flight -= 1
+
+                if failed:
+                    self._open(circuit)
+                else:
+                    self._close(circuit)
+
+                return
+            elif circuit.state == OPEN:
+                return
+
+            circuit.window.append(failed)
+
+            if len(circuit.window) >= self.min_calls:
+                error_rate = sum(circuit.window) / len(circuit.window)
+
+                if error_rate >= self.error_rate_threshold:
+                    self._open(circuit)
+
+    @staticmethod
+    def _open(circuit):
+        circuit.state = OPEN
+        circuit.opened_at = time.monotonic()
+        circuit.window.clear()
+        circuit.probes_in_flight = 0
+        circuit.generation += 1
+
+    @staticmethod
+    def _close(circuit):
+        circuit.state = CLOSED
+        circuit.window.clear()
+        circuit.probes_in_flight = 0
+        circuit.generation += 1
@@ -0,0 +1,160 @@
+
+""" Response compression negotiated via the Accept-Encoding request header:
+gzip, and Brotli if the `brotli` package is installed.
+"""
+
+import zlib
+
+import flask as fl
+
+from pyvoog.configloader import config
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULT_MIN_SIZE = 1024
+
+# Levels trading off CPU time against size: higher levels (especially for
+# Brotli) cost several times the CPU for a marginal reduction in size on
+# typical JSON payloads.
+
+DEFAULT_GZIP_LEVEL = 5
+DEFAULT_BROTLI_QUALITY = 4
+
+def compress_response(res):
+
+    """ Compress a response, either a (body, code, headers) tuple or a
+    Response, in the encoding preferred by the client. Bodies smaller than
+    the `compression_min_size` configuration value (1 KB by default) are
+    left as is, as are responses already carrying a Content-Encoding.
+    Streamed responses are compressed chunk by chunk. Strong ETags of
+    compressed responses are turned weak, as the encoded bytes differ from
+    those of the identity representation. Compression is
+    disabled if the `compression` configuration value is false.
+
+    The gzip level and Brotli quality are configurable via
+    `compression_gzip_level` and `compression_brotli_quality`.
+    """
+
+    if not config.get("compression", True) or not fl.has_request_context():
+        return res
+    elif type(res) is fl.Response:
+        return _compress_response_object(res)
+
+    (body, code, headers) = res
+
+    if any(k.lower() == "content-encoding" for k in headers):
+        return res
+
+    body = body.encode() if isinstance(body, str) else body
+
+    if len(body) < config.get("compression_min_size", DEFAULT_MIN_SIZE):
+        return res
+
+    headers = headers | {"Vary": add_vary(headers.get("Vary"), "Accept-Encoding")}
+
+    if encoding := get_preferred_encoding():
+        compressor = _make_compressor(encoding)
+
+        body = compressor.compress(body) + compressor.flush()
+        headers |= {"Content-Encoding": encoding}
+
+        if etag := headers.get("ETag"):
+            headers |= {"ETag": _weaken_etag(etag)}
+
+    return (body, code, headers)
+
+def get_preferred_encoding():
+
+    """ Return the supported encoding preferred by the client as per the
+    Accept-Encoding header, or None if no compression is acceptable.
+    """
+
+    supported_encodings = ["br", "gzip"] if brotli else ["gzip"]
+    return fl.request.accept_encodings.best_match(supported_encodings)
+
+def add_vary(vary, header):
+
+    """ Return the value of the Vary header `vary` (possibly None) with
+    `header` added, unless already present.
+    """
+
+    values = [v.strip() for v in (vary or "").split(",") if v.strip()]
+
+    if header.lower() not in (v.lower() for v in values):
+        values.append(header)
+
+    return ", ".join(values)
+
+class _BrotliCompressor:
+
+    """ Adapt `brotli.Compressor` to the interface of zlib compressors. """
+
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self, mode=zlib.Z_FINISH):
+        if mode == zlib.Z_FINISH:
+            return self._compressor.finish()
+
+        return self._compressor.flush()
+
+def _weaken_etag(etag):
+    return etag if etag.startswith("W/") else f"W/{etag}"
+
+def _make_compressor(encoding):
+    if encoding == "br":
+        return _BrotliCompressor(
+            quality=config.get("compression_brotli_quality", DEFAULT_BROTLI_QUALITY)
+        )
+
+    # A wbits value of 16 + 15 produces a gzip header and trailer.
+
+    level = config.get("compression_gzip_level", DEFAULT_GZIP_LEVEL)
+    return zlib.compressobj(level, zlib.DEFLATED, 31)
+
+def _compress_response_object(response):
+    if "Content-Encoding" in response.headers or response.direct_passthrough:
+        return response
+
+    if response.is_streamed:
+        if not (encoding := get_preferred_encoding()):
+            return response
+
+        response.response = _compress_stream(response.response, _make_compressor(encoding))
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+
+        if len(data) < config.get("compression_min_size", DEFAULT_MIN_SIZE):
+            return response
+        elif not (encoding := get_preferred_encoding()):
+            response.vary.add("Accept-Encoding")
+            return response
+
+        compressor = _make_compressor(encoding)
+        response.set_data(compressor.compress(data) + compressor.flush())
+
+    response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+
+    if etag := response.headers.get("ETag"):
+        response.headers["ETag"] = _weaken_etag(etag)
+
+    return response
+
+def _compress_stream(chunks, compressor):
+
+    # Flush the compressor after every chunk, so that the client receives
+    # chunks as these are produced.
+
+    for chunk in chunks:
+        chunk = chunk.encode() if isinstance(chunk, str) else chunk
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    yield compressor.flush()
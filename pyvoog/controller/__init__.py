@@ -1,3 +1,4 @@
 from .util import *
 from .controller import *
 from .api_base_controller import *
+from .batch_controller import *
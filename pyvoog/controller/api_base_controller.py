@@ -1,8 +1,16 @@
+import itertools
+
 from functools import wraps
 
+import flask as fl
+
+from werkzeug.exceptions import BadRequest, PreconditionFailed
+
 from pyvoog.controller import Controller, \
-    api_endpoint, scoped_endpoint, single_object_endpoint, mutating_endpoint
-from pyvoog.db import get_session
+    api_endpoint, coalesce_reads, scoped_endpoint, single_object_endpoint, mutating_endpoint, \
+    streaming_endpoint
+from pyvoog.db import get_session, retry_transaction
+from pyvoog.exceptions import ValidationError
 
 class ApiBaseController(Controller):
 
@@ -12,43 +20,117 @@ class ApiBaseController(Controller):
     configuration:
 
     - allowed_actions - a list of allowed actions on this controller.
+    - bulk_batch_size - The number of objects created per transaction by
+      `bulk_create`, 500 by default.
+    - changes_lag - The number of seconds recent changes are withheld from
+      the changes feed for (see `Controller.paginate_changes`).
+    - coalesce_reads - If true, identical concurrent index and get requests
+      are serviced by a single query (see `coalesce_reads`).
+    - index_as_rows - If true, the index endpoint reads plain rows instead of
+      model instances (see `Controller.paginate`). The output is identical,
+      but `as_dict` overrides on the model are not respected.
     - index_order_field - The default field to use for sorting index
       endpoint responses, `id` by default.
     - jwt_secret - base64-encoded JWT secret.
     - model - the backing model of this controller.
+    - rate_limit - a RateLimit, or a dict of action names mapped to
+      RateLimits, limiting the requests of every API consumer (see
+      `authenticate`).
+    - rate_limit_store - the RateLimitStore to keep track of requests in.
     - schema - the Marshmallow schema of acceptable payloads.
+
+    If the model has `include_changes_feed` set, passing `since` to the index
+    endpoint turns it into a feed of objects changed since the passed
+    timestamp or cursor, including the IDs of deleted objects if the model
+    has `include_tombstones` set (see `Controller.paginate_changes`).
+
+    Mutating actions are replayed on transient database errors such as
+    deadlocks (see `retry_transaction`).
+
+    If the model is versioned (`include_version`), the version is returned
+    in the ETag header of single object responses and updates honor the
+    If-Match request header, responding with HTTP/412 on a mismatch.
     """
 
     DEFAULT_INDEX_ORDER_FIELD = "id"
+    DEFAULT_BULK_BATCH_SIZE = 500
 
     @api_endpoint()
+    @coalesce_reads
     @scoped_endpoint
     def index(self, query):
+        if (since := fl.request.args.get("since")) is not None:
+            return self._list_changes(query, since)
+
         return (
-            self.paginate(query, order_by=self._index_order_field, descending=True),
+            self.paginate(
+                query,
+                order_by=self._index_order_field,
+                descending=True,
+                as_rows=getattr(self, "index_as_rows", False),
+            ),
             200,
         )
 
     @api_endpoint()
+    @coalesce_reads
     @single_object_endpoint
     def get(self, obj):
-        return obj
+        return self._make_object_response(obj)
 
     @api_endpoint()
+    @retry_transaction
     def create(self, *args, **kwargs):
         session, obj = self._create_object(*args, **kwargs)
 
         session.commit()
-        return obj
+        return self._make_object_response(obj)
 
     @api_endpoint()
+    @retry_transaction
     def update(self, *args, **kwargs):
         session, obj = self._update_object(*args, **kwargs)
 
         session.commit()
-        return obj
+        return self._make_object_response(obj)
+
+    @api_endpoint()
+    @streaming_endpoint
+    def bulk_create(self, items):
+
+        """ Create objects from a streamed NDJSON document or JSON array of
+        payloads (see `streaming_endpoint`), not routed by default. Items are
+        validated and inserted in batches of `bulk_batch_size`, each batch
+        committed in a transaction of its own, so that memory use is bounded
+        regardless of the size of the payload. On a validation error, the
+        errors are keyed by the index of the offending item; the batches
+        preceding it have been committed.
+        """
+
+        session = get_session()
+        batch_size = getattr(self, "bulk_batch_size", self.DEFAULT_BULK_BATCH_SIZE)
+        indexed_items = enumerate(items)
+        created = 0
+
+        while batch := list(itertools.islice(indexed_items, batch_size)):
+            objs = [self._build_bulk_object(index, payload) for (index, payload) in batch]
+
+            session.add_all(objs)
+
+            try:
+                session.commit()
+            except ValidationError as e:
+                session.rollback()
+                raise self._find_bulk_validation_error(batch, objs) or e
+
+            session.expunge_all()
+
+            created += len(objs)
+
+        return (dict(created=created), 200)
 
     @api_endpoint()
+    @retry_transaction
     @single_object_endpoint
     def delete(self, obj):
         session = get_session()
@@ -58,15 +140,53 @@ class ApiBaseController(Controller):
 
         return (None, 204)
 
+    def _list_changes(self, query, since):
+        if not getattr(self.model, "include_changes_feed", False):
+            raise BadRequest()
+
+        return (
+            self.paginate_changes(
+                query, since, as_rows=getattr(self, "index_as_rows", False)
+            ),
+            200,
+        )
+
     @property
     def _index_order_field(self):
         return getattr(self, "index_order_field", self.DEFAULT_INDEX_ORDER_FIELD)
 
+    @property
+    def _is_versioned(self):
+        return getattr(self.model, "include_version", False)
+
+    def _make_object_response(self, obj):
+        if not self._is_versioned:
+            return obj
+
+        return (obj, 200, {"ETag": f'"{obj.version}"'})
+
+    def _check_version_precondition(self, obj):
+        if_match = fl.request.if_match
+
+        # Weak tags are accepted, as compressed responses carry these (see
+        # `compress_response`) while the version identifies the object
+        # state exactly.
+
+        if self._is_versioned and if_match and not if_match.contains_weak(str(obj.version)):
+            raise PreconditionFailed()
+
     @mutating_endpoint
     def _create_object(self, payload):
+        obj = self._build_object(payload)
+        session = get_session()
+
+        session.add(obj)
+
+        return (session, obj)
+
+    def _build_object(self, payload):
         attrs = self.permit_attributes(self.schema, payload)
         obj = self.model()
-        session = get_session()
 
         for k, v in attrs.items():
             setattr(obj, k, v)
@@ -74,13 +194,34 @@ class ApiBaseController(Controller):
         if getattr(self, "_run_after_model_population", None):
             self._run_after_model_population(obj, payload, action='create')
 
-        session.add(obj)
+        return obj
 
-        return (session, obj)
+    def _build_bulk_object(self, index, payload):
+        try:
+            return self._build_object(payload)
+        except ValidationError as e:
+            raise ValidationError({index: e.messages})
+
+    def _find_bulk_validation_error(self, batch, objs):
+
+        """ Return the errors of the first object of a batch failing
+        validation, keyed by its index. Objects are validated by the session
+        on flush, so that this is only needed once the flush has failed.
+        """
+
+        for ((index, _), obj) in zip(batch, objs):
+            try:
+                obj.validate()
+            except ValidationError as e:
+                return ValidationError({index: e.messages})
+
+        return None
 
     @mutating_endpoint
     @single_object_endpoint
     def _update_object(self, obj, payload):
+        self._check_version_precondition(obj)
+
         attrs = self.permit_attributes(self.schema, payload)
         session = get_session()
 
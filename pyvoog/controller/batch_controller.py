@@ -0,0 +1,181 @@
+
+""" Multiplexing several API requests in a single HTTP request. """
+
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+
+import flask as fl
+
+from marshmallow import fields, validate
+from werkzeug.datastructures import Headers
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.test import EnvironBuilder
+
+from pyvoog.controller.controller import Controller
+from pyvoog.controller.util import api_endpoint, get_response_tuple
+from pyvoog.util import make_strict_schema
+
+# The WSGI environ key marking sub-requests, holding the batch request
+
+BATCH_PARENT_ENVIRON_KEY = "pyvoog.batch_parent"
+
+def is_batched_request():
+
+    """ Return whether the current request is a sub-request of a batch. """
+
+    return BATCH_PARENT_ENVIRON_KEY in fl.request.environ
+
+class BatchController(Controller):
+
+    """ The controller of the batch endpoint, set up by `Router` if its
+    `batch_path` is set. The endpoint takes a POST request with a JSON
+    payload listing sub-requests:
+
+        {
+            "requests": [
+                {"method": "GET", "path": "/widgets?per_page=10"},
+                {"method": "PUT", "path": "/widget/1", "body": {"name": "x"}}
+            ],
+            "concurrent": false
+        }
+
+    The batch request itself is authenticated by a JWT signed with
+    `jwt_secret`, before any sub-request is run. Every sub-request is then
+    dispatched through the app like a request of its own, including
+    `before_request` and `after_request` handlers, with the headers of the
+    batch request and any `headers` of its own, save for those describing
+    the request body, content negotiation or queueing: sub-responses are
+    always uncompressed JSON. The response lists the `status`, `headers`
+    and decoded `body` of every sub-request in order. Failing sub-requests
+    do not affect the rest, as every sub-request runs in an app context
+    (and per-request sessions) of its own.
+
+    Sub-requests are told apart by `is_batched_request` and are exempt from
+    load shedding, having been admitted along with the batch request.
+
+    JWTs are decoded once per batch, rather than once per sub-request, and
+    failures to decode are remembered likewise. The deadline of the batch
+    request applies to all sub-requests, while rate limits are enforced
+    per sub-request.
+
+    If `concurrent` is true, the sub-requests are run concurrently in up to
+    `max_workers` threads. Only request concurrent processing of
+    independent sub-requests, as the order of their execution is not
+    defined. Batches of more than `max_requests` sub-requests are rejected
+    with HTTP/413.
+    """
+
+    EXCLUDED_HEADERS = frozenset((
+        "accept",
+        "accept-encoding",
+        "content-encoding",
+        "content-length",
+        "content-type",
+        "transfer-encoding",
+        "x-request-start",
+    ))
+
+    # Per-request state shared by the batch request with its sub-requests
+
+    INHERITED_GLOBALS = ("deadline", "jwt_payloads")
+
+    schema = make_strict_schema(
+        requests=fields.List(
+            fields.Nested(make_strict_schema(
+                method=fields.String(
+                    load_default="GET",
+                    validate=validate.OneOf(("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE")),
+                ),
+                path=fields.String(required=True, validate=validate.Regexp(r"^/")),
+                headers=fields.Dict(
+                    keys=fields.String(), values=fields.String(), load_default=dict
+                ),
+                body=fields.Raw(load_default=None, allow_none=True),
+            )),
+            required=True,
+        ),
+        concurrent=fields.Boolean(load_default=False),
+    )
+
+    def __init__(self, jwt_secret, max_requests=50, max_workers=8):
+        self.jwt_secret = jwt_secret
+        self.max_requests = max_requests
+        self.max_workers = max_workers
+
+    @api_endpoint()
+    def dispatch(self):
+        payload = self.permit_attributes(self.schema, fl.request.get_json())
+        sub_requests = payload["requests"]
+
+        if len(sub_requests) > self.max_requests:
+            raise RequestEntityTooLarge(f"The batch exceeds {self.max_requests} requests")
+
+        app = fl.current_app._get_current_object()
+        inherited = {k: fl.g.get(k) for k in self.INHERITED_GLOBALS if k in fl.g}
+        environs = [self._make_environ(sub_request) for sub_request in sub_requests]
+
+        def run(environ):
+            return self._run_sub_request(app, environ, inherited)
+
+        if payload["concurrent"] and len(environs) > 1:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(environs))) as executor:
+                responses = list(executor.map(run, environs))
+        else:
+            responses = [run(environ) for environ in environs]
+
+        return dict(responses=responses)
+
+    def _make_environ(self, sub_request):
+        headers = Headers(fl.request.headers)
+
+        for (k, v) in sub_request["headers"].items():
+            headers.set(k, v)
+
+        for k in self.EXCLUDED_HEADERS:
+            headers.remove(k)
+
+        headers.set("Accept", "application/json")
+
+        builder = EnvironBuilder(
+            path=sub_request["path"],
+            base_url=fl.request.root_url,
+            method=sub_request["method"],
+            headers=headers,
+            json=sub_request["body"],
+            environ_base={
+                "REMOTE_ADDR": fl.request.remote_addr,
+                BATCH_PARENT_ENVIRON_KEY: fl.request._get_current_object(),
+            },
+        )
+
+        try:
+            return builder.get_environ()
+        finally:
+            builder.close()
+
+    def _run_sub_request(self, app, environ, inherited):
+        with app.app_context():
+            for (k, v) in inherited.items():
+                setattr(fl.g, k, v)
+
+            with app.request_context(environ):
+                res = self._get_sub_response(app)
+
+                return dict(
+                    status=res.status_code,
+                    headers=dict(res.headers),
+                    body=res.get_json(silent=True) if res.is_json else res.get_data(as_text=True),
+                )
+
+    def _get_sub_response(self, app):
+        request = fl.request
+
+        try:
+            if request.url_rule and app.view_functions[request.url_rule.endpoint] == self.dispatch:
+                return app.make_response(get_response_tuple(400, "Batches may not be nested"))
+
+            return app.full_dispatch_request()
+        except Exception:
+            logging.exception(f"Batched request {request.method} {request.full_path} failed")
+            return app.make_response(get_response_tuple(500))
@@ -1,18 +1,26 @@
+import heapq
+import itertools
 import re
 
+from datetime import datetime, timedelta, timezone
+
 from stringcase import snakecase
 
 import flask as fl
 import marshmallow.exceptions
 
 from sqlalchemy import select, and_, or_
+from werkzeug.exceptions import BadRequest
 
 from pyvoog.db import get_session
 from pyvoog.exceptions import ValidationError
+from pyvoog.timing import timed
+from pyvoog.util import format_timestamp
 
 class Controller:
     DEFAULT_PER_PAGE = 50
     MAX_PER_PAGE = 250
+    DEFAULT_CHANGES_LAG = 5
 
     def permit_attributes(self, schema, payload):
 
@@ -22,12 +30,13 @@ class Controller:
         """
 
         try:
-            return schema.load(payload)
+            with timed("payload"):
+                return schema.load(payload)
         except marshmallow.exceptions.ValidationError as e:
             e.__class__ = ValidationError
             raise
 
-    def paginate(self, query, order_by, descending=False, payload_key=None):
+    def paginate(self, query, order_by, descending=False, payload_key=None, as_rows=False):
 
         """ Given an SQLAlchemy statement (`query`) and the name of the column
         determining ordering, paginate output and return a dict. The key of the
@@ -39,6 +48,10 @@ class Controller:
         remain after the those output, the ID of the next object is returned in
         the `pagination.next_cursor`. This can be used as the value of `from` to
         the next request.
+
+        If `as_rows` is true, only the table columns of the model are selected
+        and the objects are returned as dicts built by `row_as_dict`, skipping
+        ORM instance construction altogether.
         """
 
         model = self.model
@@ -57,8 +70,13 @@ class Controller:
         if from_id:
             query = self._start_pagination_at(query, from_id, ordering_column, descending)
 
+        if as_rows:
+            query = query.with_only_columns(*model.__table__.c)
+
+        result = get_session().execute(query)
+
         try:
-            *body, _next = get_session().execute(query).scalars()
+            *body, _next = result if as_rows else result.scalars()
         except ValueError:
             empty_result = True
 
@@ -70,6 +88,9 @@ class Controller:
             payload = body
             cursor = _next.id
 
+        if as_rows:
+            payload = [model.row_as_dict(row) for row in payload]
+
         if not payload_key:
             payload_key = f'{snakecase(re.sub(r"Controller$", "", self.__class__.__name__))}s'
 
@@ -80,6 +101,131 @@ class Controller:
             }
         }
 
+    def paginate_changes(self, query, since, payload_key=None, as_rows=False):
+
+        """ Return a page of the objects matched by `query` changed since
+        `since`, in `(updated_at, id)` order, as a dict akin to the output of
+        `paginate`. The model must have `include_changes_feed` set. `since` is
+        either an ISO 8601 timestamp, matching objects updated at or after
+        it, or a cursor returned by an earlier call, matching objects after
+        the position it denotes. Pagination metadata in `pagination`
+        contains:
+
+        - next_cursor - The cursor to pass as `since` for the next page, or
+          None if no further changes remain.
+        - sync_cursor - The cursor to pass as `since` to poll for later
+          changes once all pages have been read.
+
+        If the model has `include_tombstones` set, the IDs of objects deleted
+        in the same interval are returned in `deleted`.
+
+        Changes more recent than the `changes_lag` attribute of the
+        controller (5 seconds by default) are withheld, as transactions
+        still in progress may yet commit changes timestamped before these,
+        which would be skipped by the cursor.
+        """
+
+        model = self.model
+        per_page = self._items_per_page
+        (since_at, since_id) = self._parse_changes_cursor(since)
+        lag = getattr(self, "changes_lag", self.DEFAULT_CHANGES_LAG)
+        until = datetime.now(tz=timezone.utc) - timedelta(seconds=lag)
+
+        query = (
+            self._after_change(query, model.updated_at, model.id, since_at, since_id)
+            .where(model.updated_at < until)
+            .order_by(None)
+            .order_by(model.updated_at, model.id)
+            .limit(per_page + 1)
+        )
+
+        if as_rows:
+            query = query.with_only_columns(*model.__table__.c)
+
+        session = get_session()
+        result = session.execute(query)
+        changes = (
+            (obj.updated_at, obj.id, obj) for obj in (result if as_rows else result.scalars())
+        )
+
+        deletions = ()
+
+        if getattr(model, "include_tombstones", False):
+            tombstones = model.get_tombstone_query().subquery()
+            tombstone_query = (
+                self._after_change(
+                    select(tombstones.c.deleted_at, tombstones.c.id),
+                    tombstones.c.deleted_at, tombstones.c.id, since_at, since_id
+                )
+                .where(tombstones.c.deleted_at < until)
+                .order_by(tombstones.c.deleted_at, tombstones.c.id)
+                .limit(per_page + 1)
+            )
+
+            deletions = ((*row, None) for row in session.execute(tombstone_query))
+
+        entries = list(itertools.islice(
+            heapq.merge(changes, deletions, key=lambda entry: entry[:2]), per_page + 1
+        ))
+
+        (entries, has_more) = (entries[:per_page], len(entries) > per_page)
+        sync_cursor = self._make_changes_cursor(*entries[-1][:2]) if entries else since
+        payload = [obj for (_, _, obj) in entries if obj is not None]
+
+        if as_rows:
+            payload = [model.row_as_dict(row) for row in payload]
+
+        if not payload_key:
+            payload_key = f'{snakecase(re.sub(r"Controller$", "", self.__class__.__name__))}s'
+
+        res = {
+            payload_key: payload,
+            "pagination": {
+                "next_cursor": sync_cursor if has_more else None,
+                "sync_cursor": sync_cursor,
+            }
+        }
+
+        if getattr(model, "include_tombstones", False):
+            res["deleted"] = [id for (_, id, obj) in entries if obj is None]
+
+        return res
+
+    def _after_change(self, query, timestamp_column, id_column, since_at, since_id):
+        if since_id is None:
+            return query.where(timestamp_column >= since_at)
+
+        return query.where(
+            or_(
+                timestamp_column > since_at,
+                and_(timestamp_column == since_at, id_column > since_id),
+            )
+        )
+
+    @staticmethod
+    def _make_changes_cursor(timestamp, id):
+        return f"{format_timestamp(timestamp)},{id}"
+
+    @staticmethod
+    def _parse_changes_cursor(cursor):
+
+        """ Parse a `since` value into a timestamp and an optional ID. Naive
+        timestamps are assumed to be in UTC.
+        """
+
+        (timestamp, _, id) = cursor.partition(",")
+
+        try:
+            timestamp = datetime.fromisoformat(timestamp)
+            id = int(id) if id else None
+        except ValueError:
+            raise BadRequest()
+
+        if not timestamp.tzinfo:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+
+        return (timestamp, id)
+
     def _start_pagination_at(self, query, from_id, ordering_column, descending):
         model = self.model
         milestone_value = select(ordering_column).where(model.id == from_id).scalar_subquery()
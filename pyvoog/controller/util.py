@@ -1,9 +1,13 @@
 import functools
+import inspect
 import json
 import logging
+import math
 import re
+import threading
 
-from datetime import datetime
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from datetime import datetime, timezone
 from urllib.parse import urlparse
 
 import flask as fl
@@ -12,8 +16,14 @@ import werkzeug.http
 
 from marshmallow import ValidationError as MarshmallowValidationError
 from sqlalchemy.exc import NoResultFound
+from sqlalchemy.orm.exc import StaleDataError
 from sqlalchemy import select
-from werkzeug.exceptions import BadRequest, MethodNotAllowed
+from werkzeug.exceptions import (
+    BadRequest,
+    MethodNotAllowed,
+    PreconditionFailed,
+    RequestEntityTooLarge,
+)
 
 from requests.exceptions import (
     RequestException,
@@ -22,17 +32,48 @@ from requests.exceptions import (
     TooManyRedirects,
 )
 
-from pyvoog.db import get_session
+from pyvoog.db import (
+    get_async_session,
+    get_session,
+    is_statement_timeout,
+    teardown_async_sessions,
+)
+
+from pyvoog.deadline import get_remaining_time, min_timeout, set_deadline
 
 from pyvoog.exceptions import (
     AuthenticationError,
+    DeadlineExceededError,
     ExternalError,
     ExternalAuthenticationError,
+    RateLimitExceededError,
     ValidationError,
 )
 
+from pyvoog import rate_limit
+from pyvoog.compression import add_vary, compress_response
+
 from pyvoog.signals import jwt_decoded
-from pyvoog.util import AllowException
+from pyvoog.streaming import DEFAULT_MAX_ITEM_SIZE, iterate_items
+from pyvoog.timing import timed
+from pyvoog.util import AllowException, format_timestamp
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_MIMETYPE = "application/json"
+MSGPACK_MIMETYPES = ("application/msgpack", "application/x-msgpack")
+
+# Single-flight read computations in progress, keyed by request identity.
+# Followers wait for at most COALESCING_TIMEOUT seconds if no deadline is
+# in effect.
+
+COALESCING_TIMEOUT = 30
+
+_in_flight = {}
+_in_flight_lock = threading.Lock()
 
 class _ModelEncoder(json.JSONEncoder):
 
@@ -47,11 +88,24 @@ class _ModelEncoder(json.JSONEncoder):
         return json.JSONEncoder.default(self, obj)
 
     @staticmethod
-    def zulu_isoformat(d):
-        if d.tzinfo:
-            return re.sub(r"\+00:00$", "Z", d.isoformat())
+    def msgpack_default(obj):
+
+        """ The MessagePack counterpart of `default`. Datetimes are encoded
+        as native timestamps, naive datetimes are assumed to be in UTC.
+        """
+
+        if hasattr(obj, "as_dict"):
+            return obj.as_dict()
+        elif isinstance(obj, datetime):
+            return msgpack.Timestamp.from_datetime(
+                obj if obj.tzinfo else obj.replace(tzinfo=timezone.utc)
+            )
 
-        return d.isoformat()
+        raise TypeError(f"Object of type {type(obj).__name__} is not MessagePack serializable")
+
+    @staticmethod
+    def zulu_isoformat(d):
+        return format_timestamp(d)
 
 """ ORM-specific controller decorators """
 
@@ -61,12 +115,16 @@ def scoped_endpoint(fn):
     with the default scope applied. Also applies `api_endpoint`.
     """
 
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapped_async(self, *args, **kwargs):
+            return await fn(self, *args, query=_get_scoped_query(self.model), **kwargs)
+
+        return wrapped_async
+
     @functools.wraps(fn)
     def wrapped(self, *args, **kwargs):
-        scope = self.model.default_scope()
-        query = select(self.model).filter_by(**scope)
-
-        return fn(self, *args, query=query, **kwargs)
+        return fn(self, *args, query=_get_scoped_query(self.model), **kwargs)
 
     return wrapped
 
@@ -74,11 +132,19 @@ def single_object_endpoint(fn):
 
     """ A decorator enhancing `scoped_endpoint` and providing the `obj`
     parameter: an object of `self.model`, looked up by the effective default
-    scope and incoming ID.
+    scope and incoming ID. For async actions, the object is looked up via
+    the per-request async session.
     """
 
     @functools.wraps(fn)
     def look_up_object(fn):
+        if inspect.iscoroutinefunction(fn):
+            async def wrapped_async(self, *args, id, query, **kwargs):
+                result = await get_async_session().execute(query.filter_by(id=id))
+                return await fn(self, *args, obj=result.scalar_one(), **kwargs)
+
+            return wrapped_async
+
         def wrapped(self, *args, id, query, **kwargs):
             obj = get_session().execute(query.filter_by(id=id)).scalar_one()
             return fn(self, *args, obj=obj, **kwargs)
@@ -101,24 +167,49 @@ def api_endpoint(*dec_args, jwt_secret=None, **dec_kwargs):
     In addition, HTTP/405 is raised if the `allowed_actions` itearble
     attribute is present on the controller and does not contain the
     action servicing the request.
+
+    If the controller has the `request_timeout` attribute, the deadline of
+    the request is set to at most this many seconds from now (see
+    `pyvoog.deadline`).
+
+    If the controller has the `rate_limit` attribute, authenticated requests
+    are rate limited as documented in `authenticate`.
+
+    All decorators in this module support both plain and `async def`
+    actions. Per-request async sessions are torn down after an async action
+    has completed.
     """
 
     def decorator(fn):
-        @functools.wraps(fn)
-        def wrapped(self, *args, **kwargs):
+        def decorate(self):
             nonlocal dec_kwargs
             nonlocal jwt_secret
 
             _raise_on_disallowed_action(controller=self, action=fn)
 
+            if (request_timeout := getattr(self, "request_timeout", None)) is not None:
+                set_deadline(request_timeout)
+
             if jwt_secret is None:
                 jwt_secret = self.jwt_secret
 
-            decorated = json_endpoint(
+            return json_endpoint(
                 emit_http_codes(authenticate(*dec_args, jwt_secret=jwt_secret, **dec_kwargs)(fn))
             )
 
-            return decorated(self, *args, **kwargs)
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapped_async(self, *args, **kwargs):
+                try:
+                    return await decorate(self)(self, *args, **kwargs)
+                finally:
+                    await teardown_async_sessions()
+
+            return wrapped_async
+
+        @functools.wraps(fn)
+        def wrapped(self, *args, **kwargs):
+            return decorate(self)(self, *args, **kwargs)
 
         return wrapped
 
@@ -135,30 +226,26 @@ def json_endpoint(fn):
     - if its length is >1, the first element is the payload, the second is
       the HTTP status code and the optional third element is a dict of extra
       headers.
-      """
+
+    If the `msgpack` package is installed and the Accept request header
+    prefers MessagePack (`application/msgpack` or `application/x-msgpack`)
+    to JSON, the payload is encoded as MessagePack instead, with datetimes
+    encoded as native timestamps. Responses then carry `Vary: Accept`.
+
+    Responses, including streamed Responses, are compressed as negotiated
+    by the Accept-Encoding request header (see `compress_response`).
+    """
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapped_async(self, *args, **kwargs):
+            return compress_response(_make_json_response(await fn(self, *args, **kwargs)))
+
+        return wrapped_async
 
     @functools.wraps(fn)
     def wrapped(self, *args, **kwargs):
-        res = fn(self, *args, **kwargs)
-        res_is_tuple = type(res) is tuple
-        headers = {"Content-Type": "application/json"}
-        payload = res
-        code = 200
-
-        if type(res) is fl.Response:
-            return res
-        elif res_is_tuple and len(res) == 1:
-            code = res[0]
-            payload = werkzeug.http.HTTP_STATUS_CODES[code]
-        elif res_is_tuple:
-            payload = res[0]
-            code = res[1]
-
-            with AllowException(IndexError):
-                if res[2] is not None:
-                    headers |= res[2]
-
-        return (json.dumps(payload, cls=_ModelEncoder), code, headers)
+        return compress_response(_make_json_response(fn(self, *args, **kwargs)))
 
     return wrapped
 
@@ -169,29 +256,36 @@ def emit_http_codes(fn):
     - BadRequest — HTTP/400
     - AuthenticationError — HTTP/401
     - None return value or a NoResultFound exception — HTTP/404
+    - StaleDataError (a concurrent update of a versioned model) — HTTP/409
+    - PreconditionFailed — HTTP/412
+    - RequestEntityTooLarge — HTTP/413
     - ValidationError (pyvoog or vanilla Marshmallow) — HTTP/422 with a
       payload describing the errors in `errors`.
     - NotImplementedError — HTTP/501.
+    - RateLimitExceededError — HTTP/429 with the Retry-After header.
+    - DeadlineExceededError or a statement timeout — HTTP/504.
 
     See also `handle_upstream_errors` for a complementary decorator.
     """
 
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapped_async(self, *args, **kwargs):
+            try:
+                res = await fn(self, *args, **kwargs)
+            except Exception as e:
+                res = _get_error_response(e)
+
+            return get_response_tuple(404) if res is None else res
+
+        return wrapped_async
+
     @functools.wraps(fn)
     def wrapped(self, *args, **kwargs):
         try:
             res = fn(self, *args, **kwargs)
-        except AuthenticationError as e:
-            res = get_response_tuple(401, str(e))
-        except NoResultFound:
-            res = get_response_tuple(404)
-        except BadRequest:
-            res = get_response_tuple(400)
-        except ValidationError as e:
-            res = (dict(errors=e.errors), 422)
-        except MarshmallowValidationError as e:
-            res = (dict(errors=e.normalized_messages()), 422)
-        except NotImplementedError:
-            res = get_response_tuple(501)
+        except Exception as e:
+            res = _get_error_response(e)
 
         return get_response_tuple(404) if res is None else res
 
@@ -203,22 +297,33 @@ def authenticate(jwt_secret):
     failure and emits the `jwt_decoded` signal with the decoded JWT payload
     on success. The `exp` claim is currently required unconditionally on the
     token and stale tokens are rejected.
+
+    Once authenticated, the request is subject to the `rate_limit` attribute
+    of the controller, if present: either a RateLimit applying to all
+    actions or a dict mapping action names to RateLimits. Requests are
+    counted per controller (and action, if limited per action) and value of
+    the limit's JWT claim, falling back to the remote address if the claim
+    is missing. Buckets are kept in the controller's `rate_limit_store`,
+    defaulting to a shared in-process store. Requests exceeding the limit
+    raise RateLimitExceededError.
     """
 
     def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapped_async(self, *args, **kwargs):
+                jwt_payload = _authenticate_request(jwt_secret)
+                _enforce_rate_limit(self, fn, jwt_payload)
+
+                return await fn(self, *args, **kwargs)
+
+            return wrapped_async
+
         @functools.wraps(fn)
         def wrapped(self, *args, **kwargs):
-            jwt = _get_jwt_from_request()
-
-            try:
-                payload = pyjwt.decode(
-                    jwt, jwt_secret, algorithms="HS256", options=dict(require=["exp"])
-                )
-            except Exception as e:
-                logging.warn(f"Authentication failure for token \"{jwt}\": {e}")
-                raise AuthenticationError("Not Authenticated")
+            jwt_payload = _authenticate_request(jwt_secret)
+            _enforce_rate_limit(self, fn, jwt_payload)
 
-            jwt_decoded.send(fl.current_app, payload=payload)
             return fn(self, *args, **kwargs)
 
         return wrapped
@@ -228,12 +333,62 @@ def authenticate(jwt_secret):
 def mutating_endpoint(fn):
 
     """ A decorator providing the `payload` parameter containing the
-    deserialized incoming JSON.
+    deserialized incoming JSON. If the `msgpack` package is installed,
+    MessagePack payloads (as per the Content-Type header) are accepted as
+    well. Timestamps are decoded into ISO 8601 strings, as would be passed
+    in JSON, so that payloads validate identically.
+    """
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapped_async(self, *args, **kwargs):
+            return await fn(self, *args, payload=_get_request_payload(), **kwargs)
+
+        return wrapped_async
+
+    @functools.wraps(fn)
+    def wrapped(self, *args, **kwargs):
+        return fn(self, *args, payload=_get_request_payload(), **kwargs)
+
+    return wrapped
+
+def streaming_endpoint(fn):
+
+    """ A decorator providing the `items` parameter: an iterator over the
+    items of the incoming payload, parsed incrementally as these are read
+    from the request body. The payload is either an NDJSON document (as
+    per the Content-Type header) or a JSON array. Limits are configured by
+    the following attributes on the controller:
+
+    - max_payload_items - The maximum number of items, unlimited by default.
+    - max_payload_item_size - The maximum size of an item in characters,
+      1 MB by default.
+    - max_payload_size - The maximum size of the payload in bytes, unlimited
+      by default.
+
+    Exceeding a limit raises RequestEntityTooLarge, malformed input raises
+    BadRequest, either once the offending item is reached.
     """
 
+    def get_items(self):
+        return iterate_items(
+            fl.request.stream,
+            fl.request.mimetype,
+            max_items=getattr(self, "max_payload_items", None),
+            max_item_size=getattr(self, "max_payload_item_size", DEFAULT_MAX_ITEM_SIZE),
+            max_size=getattr(self, "max_payload_size", None),
+        )
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapped_async(self, *args, **kwargs):
+            return await fn(self, *args, items=get_items(self), **kwargs)
+
+        return wrapped_async
+
     @functools.wraps(fn)
     def wrapped(self, *args, **kwargs):
-        return fn(self, *args, payload=fl.request.get_json(), **kwargs)
+        return fn(self, *args, items=get_items(self), **kwargs)
 
     return wrapped
 
@@ -246,32 +401,80 @@ def handle_upstream_errors(fn):
     See also `emit_http_codes` for a complementary decorator.
     """
 
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapped_async(*args, **kwargs):
+            try:
+                return await fn(*args, **kwargs)
+            except (ExternalError, RequestException) as e:
+                return _get_upstream_error_response(e)
+
+        return wrapped_async
+
     @functools.wraps(fn)
     def wrapped(*args, **kwargs):
         try:
             return fn(*args, **kwargs)
-        except ExternalError as e:
-            extra_args = dict(external_message=e.external_message) if e.external_message else {}
-            code = 401 if isinstance(e, ExternalAuthenticationError) else 502
-
-            return get_response_tuple(code, e.message, **extra_args)
-        except RequestException as e:
-            url = e.request.url
-            host = urlparse(url).hostname
-
-            if isinstance(e, Timeout):
-                code = 504
-                message = f"Timed out connecting to {host}"
-            elif isinstance(e, ConnectionError):
-                code = 500
-                message = f"Failed connecting to {host}"
-            elif isinstance(e, TooManyRedirects):
-                code = 502
-                message = f"The request to {url} resulted in too many redirects"
-            else:
-                raise e
-
-            return get_response_tuple(code, message, details=str(e))
+        except (ExternalError, RequestException) as e:
+            return _get_upstream_error_response(e)
+
+    return wrapped
+
+def coalesce_reads(fn):
+
+    """ A decorator coalescing identical concurrent requests to a read
+    action, if the `coalesce_reads` attribute of the controller is true.
+    Requests are identical if they map to the same controller, action,
+    default scope, arguments, query string and Accept header. The first
+    request runs the action and encodes the response, while the rest wait
+    for it and respond with the same body (or raise the same error).
+
+    Followers wait until the deadline of the request, or for at most
+    COALESCING_TIMEOUT seconds if there is none, failing with HTTP/504.
+
+    Apply between `api_endpoint` and the action, so that every request is
+    authenticated on its own. Only useful with threaded workers; async
+    actions are not coalesced.
+    """
+
+    if inspect.iscoroutinefunction(fn):
+        return fn
+
+    @functools.wraps(fn)
+    def wrapped(self, *args, **kwargs):
+        if not getattr(self, "coalesce_reads", False):
+            return fn(self, *args, **kwargs)
+
+        key = _get_coalescing_key(self, fn, args, kwargs)
+
+        with _in_flight_lock:
+            is_leader = (future := _in_flight.get(key)) is None
+
+            if is_leader:
+                future = _in_flight[key] = Future()
+
+        if is_leader:
+            try:
+                future.set_result(_encode_shared_result(fn(self, *args, **kwargs)))
+            except Exception as e:
+                future.set_exception(e)
+            except BaseException:
+
+                # Do not propagate e.g. a worker timeout or interrupt to the
+                # threads of followers.
+
+                future.set_exception(RuntimeError("The coalesced request was aborted"))
+                raise
+            finally:
+                with _in_flight_lock:
+                    del _in_flight[key]
+
+        try:
+            res = future.result(timeout=min_timeout(get_remaining_time(), COALESCING_TIMEOUT))
+        except FutureTimeoutError:
+            raise DeadlineExceededError()
+
+        return None if res is None else fl.Response(res[0], status=res[1], headers=res[2])
 
     return wrapped
 
@@ -288,6 +491,211 @@ def get_response_tuple(code, /, message=None, **kwargs):
 
     return (payload, code)
 
+def _get_scoped_query(model):
+    return select(model).filter_by(**model.default_scope())
+
+def _make_json_response(res):
+    res_is_tuple = type(res) is tuple
+    use_msgpack = _prefers_msgpack()
+    headers = {"Content-Type": MSGPACK_MIMETYPES[0] if use_msgpack else JSON_MIMETYPE}
+    payload = res
+    code = 200
+
+    if type(res) is fl.Response:
+        return res
+    elif res_is_tuple and len(res) == 1:
+        code = res[0]
+        payload = werkzeug.http.HTTP_STATUS_CODES[code]
+    elif res_is_tuple:
+        payload = res[0]
+        code = res[1]
+
+        with AllowException(IndexError):
+            if res[2] is not None:
+                headers |= res[2]
+
+    # The encoding depends on the Accept header, if MessagePack is available
+
+    if msgpack:
+        headers["Vary"] = add_vary(headers.get("Vary"), "Accept")
+
+    with timed("encode"):
+        if use_msgpack:
+            body = msgpack.packb(payload, default=_ModelEncoder.msgpack_default, datetime=False)
+        else:
+            body = json.dumps(payload, cls=_ModelEncoder)
+
+    return (body, code, headers)
+
+def _prefers_msgpack():
+    if not msgpack or not fl.has_request_context():
+        return False
+
+    best_match = fl.request.accept_mimetypes.best_match((JSON_MIMETYPE, *MSGPACK_MIMETYPES))
+    return best_match in MSGPACK_MIMETYPES
+
+def _get_request_payload():
+    if not msgpack or fl.request.mimetype not in MSGPACK_MIMETYPES:
+        return fl.request.get_json()
+
+    try:
+        payload = msgpack.unpackb(fl.request.get_data(), timestamp=3)
+    except Exception as e:
+        logging.warning(f"Failed decoding a MessagePack payload: {e}")
+        raise BadRequest()
+
+    return _stringify_datetimes(payload)
+
+def _stringify_datetimes(obj):
+    if isinstance(obj, datetime):
+        return format_timestamp(obj)
+    elif isinstance(obj, dict):
+        return {k: _stringify_datetimes(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [_stringify_datetimes(v) for v in obj]
+
+    return obj
+
+def _get_coalescing_key(controller, action, args, kwargs):
+    model = getattr(controller, "model", None)
+    default_scope = getattr(model, "default_scope", None)
+    scope = default_scope() if default_scope else {}
+
+    return (
+        type(controller).__name__,
+        action.__name__,
+        repr(sorted(scope.items())),
+        repr(args),
+        repr(sorted(kwargs.items())),
+        fl.request.query_string,
+        fl.request.headers.get("Accept"),
+    )
+
+def _encode_shared_result(res):
+
+    """ Turn an action's result into an immutable (body, code, headers)
+    tuple to be shared by coalesced requests. None is passed through.
+    """
+
+    if res is None:
+        return None
+    elif type(res) is fl.Response:
+        return (res.get_data(), res.status_code, dict(res.headers))
+
+    return _make_json_response(res)
+
+def _get_error_response(e):
+
+    """ Map an error raised by an action to a response as documented in
+    `emit_http_codes`, re-raise unknown errors.
+    """
+
+    if isinstance(e, AuthenticationError):
+        return get_response_tuple(401, str(e))
+    elif isinstance(e, NoResultFound):
+        return get_response_tuple(404)
+    elif isinstance(e, BadRequest):
+        return get_response_tuple(400, _get_custom_description(e))
+    elif isinstance(e, StaleDataError):
+        return get_response_tuple(409, "The object has been modified concurrently")
+    elif isinstance(e, PreconditionFailed):
+        return get_response_tuple(412)
+    elif isinstance(e, RequestEntityTooLarge):
+        return get_response_tuple(413, e.description)
+    elif isinstance(e, ValidationError):
+        return (dict(errors=e.errors), 422)
+    elif isinstance(e, MarshmallowValidationError):
+        return (dict(errors=e.normalized_messages()), 422)
+    elif isinstance(e, RateLimitExceededError):
+        return (*get_response_tuple(429), {"Retry-After": str(math.ceil(e.retry_after))})
+    elif isinstance(e, NotImplementedError):
+        return get_response_tuple(501)
+    elif isinstance(e, DeadlineExceededError) or is_statement_timeout(e):
+        return get_response_tuple(504, "Request deadline exceeded")
+
+    raise e
+
+def _get_custom_description(e):
+
+    """ Return the description of an HTTPException unless it is the
+    generic one of its class.
+    """
+
+    return e.description if e.description != type(e).description else None
+
+def _get_upstream_error_response(e):
+    if isinstance(e, ExternalError):
+        extra_args = dict(external_message=e.external_message) if e.external_message else {}
+        code = 401 if isinstance(e, ExternalAuthenticationError) else 502
+
+        return get_response_tuple(code, e.message, **extra_args)
+
+    url = e.request.url
+    host = urlparse(url).hostname
+
+    if isinstance(e, Timeout):
+        code = 504
+        message = f"Timed out connecting to {host}"
+    elif isinstance(e, ConnectionError):
+        code = 500
+        message = f"Failed connecting to {host}"
+    elif isinstance(e, TooManyRedirects):
+        code = 502
+        message = f"The request to {url} resulted in too many redirects"
+    else:
+        raise e
+
+    return get_response_tuple(code, message, details=str(e))
+
+def _authenticate_request(jwt_secret):
+    jwt = _get_jwt_from_request()
+
+    # Outcomes of decoding tokens earlier in the request, shared with
+    # batched sub-requests (see BatchController). None marks a failure.
+
+    decoded_payloads = fl.g.setdefault("jwt_payloads", {})
+
+    if (jwt, jwt_secret) not in decoded_payloads:
+        try:
+            decoded_payloads[(jwt, jwt_secret)] = _decode_jwt(jwt, jwt_secret)
+        except AuthenticationError:
+            decoded_payloads[(jwt, jwt_secret)] = None
+            raise
+
+    if (payload := decoded_payloads[(jwt, jwt_secret)]) is None:
+        raise AuthenticationError("Not Authenticated")
+
+    jwt_decoded.send(fl.current_app, payload=payload)
+
+    return payload
+
+def _decode_jwt(jwt, jwt_secret):
+    try:
+        with timed("auth"):
+            return pyjwt.decode(
+                jwt, jwt_secret, algorithms="HS256", options=dict(require=["exp"])
+            )
+    except Exception as e:
+        logging.warn(f"Authentication failure for token \"{jwt}\": {e}")
+        raise AuthenticationError("Not Authenticated")
+
+def _enforce_rate_limit(controller, action, jwt_payload):
+    limit = getattr(controller, "rate_limit", None)
+    key = type(controller).__name__
+
+    if isinstance(limit, dict):
+        limit = limit.get(action.__name__)
+        key = f"{key}.{action.__name__}"
+
+    if limit is None:
+        return
+
+    subject = jwt_payload.get(limit.claim) or fl.request.remote_addr
+    store = getattr(controller, "rate_limit_store", None) or rate_limit.default_store
+
+    if retry_after := store.consume(f"{key}:{subject}", limit):
+        raise RateLimitExceededError(retry_after=retry_after)
+
 def _get_jwt_from_request():
     if not (jwt := fl.request.args.get("token")):
         try:
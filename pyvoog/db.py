@@ -1,4 +1,8 @@
+import functools
 import logging
+import random
+import sqlite3
+import time
 
 from collections import namedtuple
 from contextlib import contextmanager
@@ -7,13 +11,30 @@ from itertools import chain
 import flask as fl
 
 from sqlalchemy import create_engine, engine, event
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
 
-from pyvoog.exceptions import NotInitializedError
+from pyvoog.deadline import get_remaining_time
+from pyvoog.exceptions import DeadlineExceededError, NotInitializedError
+from pyvoog.signals import transaction_retried
 
 _PerRequestSession = namedtuple('_PerRequestSession', ['value'])
+_PerRequestAsyncSession = namedtuple('_PerRequestAsyncSession', ['value'])
 
 _engine = None
+_async_engine = None
+
+# PostgreSQL SQLSTATEs for serialization_failure and deadlock_detected, MySQL
+# error codes for ER_LOCK_WAIT_TIMEOUT and ER_LOCK_DEADLOCK.
+
+RETRYABLE_SQLSTATES = frozenset(("40001", "40P01"))
+RETRYABLE_MYSQL_ERRNOS = frozenset((1205, 1213))
+
+# PostgreSQL SQLSTATE for query_canceled, raised on statement timeouts.
+
+STATEMENT_TIMEOUT_SQLSTATE = "57014"
 
 class ValidatingSession(Session):
 
@@ -37,6 +58,43 @@ def setup_database(db_url, **kwargs):
 
     return _engine
 
+def dispose_engine(close=True):
+
+    """ Dispose of the connection pool of the engine, if one has been set
+    up. In a forked child process, pass `close=False` to discard the pooled
+    connections inherited from the parent without closing them.
+    """
+
+    if _engine is not None:
+        _engine.dispose(close=close)
+
+def get_engine():
+    if not isinstance(_engine, engine.Engine):
+        raise NotInitializedError("Database engine has not been set up.")
+
+    return _engine
+
+def setup_async_database(db_url, **kwargs):
+
+    """ As `setup_database`, but set up an asyncio engine for use with
+    `get_async_session`. The URL must specify an async driver (e.g.
+    `postgresql+asyncpg://`). Flask runs every async view in an event loop of
+    its own and connections cannot be shared across event loops, hence
+    connection pooling is disabled unless `poolclass` is passed explicitly.
+    """
+
+    global _async_engine
+
+    _async_engine = create_async_engine(db_url, echo=False, **({"poolclass": NullPool} | kwargs))
+
+    return _async_engine
+
+def get_async_engine():
+    if not isinstance(_async_engine, AsyncEngine):
+        raise NotInitializedError("Async database engine has not been set up.")
+
+    return _async_engine
+
 def get_session(key="session", cls=ValidatingSession):
 
     """ Return a per-request SQLAlchemy Session, creating one if needed.
@@ -44,15 +102,20 @@ def get_session(key="session", cls=ValidatingSession):
     The teardown listener must be registered separately at app
     initialization, as this is no longer allowed once a request is in
     progress.
+
+    If a deadline is in effect for the request, every transaction begun by
+    the session is limited to the remaining time via a statement timeout
+    (only on PostgreSQL), or fails with DeadlineExceededError if the
+    deadline has already passed.
     """
 
     if key not in fl.g:
         logging.debug(f"Setting up per-request session '{key}'")
 
-        if not isinstance(_engine, engine.Engine):
-            raise NotInitializedError("Database engine has not been set up.")
+        session = cls(get_engine())
+        event.listen(session, "after_begin", _apply_statement_timeout)
 
-        setattr(fl.g, key, _PerRequestSession(cls(_engine)))
+        setattr(fl.g, key, _PerRequestSession(session))
 
     return fl.g.get(key).value
 
@@ -62,6 +125,26 @@ def get_plain_session():
 
     return get_session(key="plain_session", cls=Session)
 
+def get_async_session(key="async_session", sync_session_cls=ValidatingSession):
+
+    """ The asyncio counterpart of `get_session`, returning a per-request
+    AsyncSession proxying a `sync_session_cls` instance. Objects are not
+    expired on commit, as lazy loading is not possible when serializing the
+    response. Per-request async sessions are closed by `api_endpoint`;
+    elsewhere, await `teardown_async_sessions` at the end of the request.
+    """
+
+    if key not in fl.g:
+        logging.debug(f"Setting up per-request async session '{key}'")
+
+        session = AsyncSession(
+            get_async_engine(), sync_session_class=sync_session_cls, expire_on_commit=False
+        )
+
+        setattr(fl.g, key, _PerRequestAsyncSession(session))
+
+    return fl.g.get(key).value
+
 def teardown_sessions(exc):
     session_keys = list(filter(lambda k: isinstance(fl.g.get(k), _PerRequestSession), fl.g))
 
@@ -71,6 +154,15 @@ def teardown_sessions(exc):
         session = fl.g.pop(key).value
         session.close()
 
+async def teardown_async_sessions():
+    session_keys = list(filter(lambda k: isinstance(fl.g.get(k), _PerRequestAsyncSession), fl.g))
+
+    for key in session_keys:
+        logging.debug(f"Tearing down per-request async session '{key}'")
+
+        session = fl.g.pop(key).value
+        await session.close()
+
 @contextmanager
 def temporary_session(cls=ValidatingSession):
     session = cls(_engine)
@@ -79,3 +171,121 @@ def temporary_session(cls=ValidatingSession):
         yield session
     finally:
         session.close()
+
+def _apply_statement_timeout(session, transaction, connection):
+    if (remaining := get_remaining_time()) is None:
+        return
+    elif remaining <= 0:
+        raise DeadlineExceededError("Request deadline exceeded")
+
+    if connection.dialect.name == "postgresql":
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {max(1, int(remaining * 1000))}")
+
+class _TransactionAttempt:
+
+    """ A context manager representing a single attempt of a transaction
+    in `retrying_transaction`. Swallows retryable errors (after rolling back
+    the session) unless this is the last attempt.
+    """
+
+    def __init__(self, session, attempt, is_last):
+        self.session = session
+        self.attempt = attempt
+        self.is_last = is_last
+        self.error = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_val is None or self.is_last or not is_retryable_error(exc_val):
+            return False
+
+        self.error = exc_val
+        (self.session or get_session()).rollback()
+
+        return True
+
+def is_retryable_error(e):
+
+    """ Return whether an exception signifies a transient transaction
+    failure (a serialization failure, deadlock or lock timeout), after which
+    the transaction may be replayed.
+    """
+
+    if not isinstance(e, DBAPIError):
+        return False
+
+    orig = e.orig
+    sqlstate = getattr(orig, "pgcode", None) or getattr(orig, "sqlstate", None)
+
+    if sqlstate is not None:
+        return sqlstate in RETRYABLE_SQLSTATES
+    elif isinstance(orig, sqlite3.OperationalError):
+        return "database is locked" in str(orig)
+
+    return bool(orig.args) and orig.args[0] in RETRYABLE_MYSQL_ERRNOS
+
+def is_statement_timeout(e):
+    if not isinstance(e, DBAPIError):
+        return False
+
+    orig = e.orig
+    sqlstate = getattr(orig, "pgcode", None) or getattr(orig, "sqlstate", None)
+
+    return sqlstate == STATEMENT_TIMEOUT_SQLSTATE
+
+def retrying_transaction(session=None, max_attempts=3, base_delay=0.05, max_delay=1.0):
+
+    """ Yield context managers wrapping successive attempts of a transaction.
+    If a retryable error (see `is_retryable_error`) escapes an attempt, the
+    session (the per-request session by default) is rolled back and, after
+    a randomized exponential backoff, the next attempt is yielded. Every
+    retry is signalled via `transaction_retried`. The error is raised if the
+    last of `max_attempts` attempts fails.
+
+        for attempt in retrying_transaction(session):
+            with attempt:
+                obj = session.get(Model, id)
+                obj.counter += 1
+                session.commit()
+
+    Note that the entire unit of work, including modifications to objects,
+    must be performed within the attempt, as the rollback expires all
+    changes.
+    """
+
+    for i in range(1, max_attempts + 1):
+        attempt = _TransactionAttempt(session, i, is_last=(i == max_attempts))
+
+        yield attempt
+
+        if attempt.error is None:
+            return
+
+        delay = random.uniform(0, min(max_delay, base_delay * 2 ** (i - 1)))
+
+        logging.warning(
+            f"Retrying transaction in {delay:.3f}s after a failed attempt {i}: {attempt.error}"
+        )
+
+        transaction_retried.send(None, attempt=i, error=attempt.error)
+        time.sleep(delay)
+
+def retry_transaction(fn=None, **retry_kwargs):
+
+    """ A decorator replaying the wrapped routine in a transaction as per
+    `retrying_transaction`, to which any keyword arguments are passed. May
+    be applied with or without arguments.
+    """
+
+    if fn is None:
+        return functools.partial(retry_transaction, **retry_kwargs)
+
+    @functools.wraps(fn)
+    def wrapped(*args, **kwargs):
+        for attempt in retrying_transaction(**retry_kwargs):
+            with attempt:
+                return fn(*args, **kwargs)
+
+    return wrapped
@@ -0,0 +1,68 @@
+
+""" Per-request deadlines. A deadline is an overall time budget for
+servicing a request, propagated to upstream calls made via UserAgent and
+to SQL statements executed in per-request sessions.
+"""
+
+import math
+import time
+
+import flask as fl
+
+from pyvoog.configloader import config
+
+DEADLINE_HEADER = "X-Request-Timeout"
+
+def track_request_deadlines(app):
+
+    """ Call with an application instance to register a `before_request`
+    handler setting the deadline of every request. The budget is taken from
+    the `request_timeout` configuration value and the `X-Request-Timeout`
+    request header (both in seconds), whichever is smaller. Header values
+    other than finite positive numbers are ignored.
+    """
+
+    def set_request_deadline():
+        if timeout := config.get("request_timeout"):
+            set_deadline(float(timeout))
+
+        try:
+            timeout = float(fl.request.headers[DEADLINE_HEADER])
+        except (KeyError, ValueError):
+            return
+
+        if math.isfinite(timeout) and timeout > 0:
+            set_deadline(timeout)
+
+    app.before_request(set_request_deadline)
+
+def set_deadline(timeout):
+
+    """ Set the deadline of the current request `timeout` seconds from now,
+    unless an earlier deadline is already in effect.
+    """
+
+    deadline = time.monotonic() + timeout
+    current_deadline = fl.g.get("deadline")
+
+    if current_deadline is None or deadline < current_deadline:
+        fl.g.deadline = deadline
+
+def get_remaining_time():
+
+    """ Return the number of seconds remaining until the deadline of the
+    current request (negative if the deadline has passed), or None if no
+    deadline is in effect.
+    """
+
+    if not fl.has_app_context() or (deadline := fl.g.get("deadline")) is None:
+        return None
+
+    return deadline - time.monotonic()
+
+def min_timeout(*timeouts):
+
+    """ Return the smallest of the passed timeouts, ignoring Nones. """
+
+    timeouts = [t for t in timeouts if t is not None]
+    return min(timeouts) if timeouts else None
@@ -6,9 +6,21 @@ from requests import Response
 class AuthenticationError(Exception):
     pass
 
+class DeadlineExceededError(Exception):
+    pass
+
 class NotInitializedError(Exception):
     pass
 
+@define(str=True)
+class RateLimitExceededError(Exception):
+
+    """ Raised when a rate limit has been exhausted. `retry_after` is the
+    number of seconds until the next request will be allowed.
+    """
+
+    retry_after: float = 0
+
 class ValidationError(marshmallow.ValidationError):
     @property
     def errors(self):
@@ -27,3 +39,9 @@ class ExternalError(Exception):
 
 class ExternalAuthenticationError(ExternalError):
     pass
+
+class CircuitOpenError(ExternalError):
+
+    """ Raised instead of calling an upstream host while its circuit breaker
+    is open.
+    """
@@ -0,0 +1,223 @@
+
+""" An HTTP response cache for UserAgent, honoring the freshness lifetimes
+of responses and revalidating stale responses via conditional requests.
+"""
+
+import hashlib
+import re
+import threading
+import time
+
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+
+import requests
+
+from attrs import define, evolve
+from requests.structures import CaseInsensitiveDict
+
+CACHEABLE_STATUSES = (200,)
+
+@define
+class CacheEntry:
+
+    """ A cached response along with its expiry time (a Unix timestamp) and
+    the values of request headers listed in its Vary header.
+    """
+
+    status_code: int
+    headers: dict
+    content: bytes
+    url: str
+    encoding: str = None
+    expires_at: float = 0
+    vary: dict = {}
+
+    @classmethod
+    def from_response(cls, response, request_headers):
+
+        """ Construct an entry from a Response, unless the response may not be
+        stored. Responses without a freshness lifetime are only stored if
+        these can be revalidated.
+        """
+
+        headers = response.headers
+        directives = _parse_cache_control(headers)
+        vary = [h.strip() for h in headers.get("Vary", "").split(",") if h.strip()]
+
+        if (
+            response.status_code not in CACHEABLE_STATUSES
+            or "no-store" in directives
+            or "*" in vary
+        ):
+            return None
+
+        entry = cls(
+            status_code=response.status_code,
+            headers=dict(headers),
+            content=response.content,
+            url=response.url,
+            encoding=response.encoding,
+            vary={h.lower(): request_headers.get(h) for h in vary},
+        ).refreshed(headers)
+
+        if entry.is_fresh or entry.validators:
+            return entry
+
+        return None
+
+    @property
+    def is_fresh(self):
+        return time.time() < self.expires_at
+
+    @property
+    def size(self):
+        return len(self.content) + sum(len(k) + len(v) for k, v in self.headers.items())
+
+    @property
+    def validators(self):
+
+        """ Return the conditional request headers for revalidating the
+        entry.
+        """
+
+        validators = {}
+
+        if etag := self.headers.get("ETag"):
+            validators["If-None-Match"] = etag
+        if last_modified := self.headers.get("Last-Modified"):
+            validators["If-Modified-Since"] = last_modified
+
+        return validators
+
+    def matches(self, request_headers):
+        headers = CaseInsensitiveDict(request_headers)
+        return all(headers.get(k) == v for k, v in self.vary.items())
+
+    def refreshed(self, headers):
+
+        """ Return a copy of the entry with its headers and expiry time updated
+        from a fresh response (e.g. an HTTP/304 received on revalidation).
+        The entry itself is left intact, as it may still be held by a store
+        accounting for its size.
+        """
+
+        headers = self.headers | {
+            k: v for k, v in headers.items() if k.lower() != "content-length"
+        }
+
+        return evolve(
+            self,
+            headers=headers,
+            expires_at=time.time() + _get_freshness_lifetime(CaseInsensitiveDict(headers)),
+        )
+
+    def to_response(self):
+        response = requests.Response()
+
+        response.status_code = self.status_code
+        response.headers = CaseInsensitiveDict(self.headers)
+        response.url = self.url
+        response.encoding = self.encoding
+        response._content = self.content
+
+        return response
+
+class CacheStore:
+
+    """ The interface of response cache stores, mapping string keys to
+    CacheEntries. Implementations must be thread-safe.
+    """
+
+    def get(self, key):
+        raise NotImplementedError()
+
+    def set(self, key, entry):
+        raise NotImplementedError()
+
+    def delete(self, key):
+        raise NotImplementedError()
+
+class LRUCacheStore(CacheStore):
+
+    """ An in-process store evicting the least recently used entries once
+    the total size of the entries exceeds `max_bytes`.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if (entry := self._entries.get(key)) is not None:
+                self._entries.move_to_end(key)
+
+            return entry
+
+    def set(self, key, entry):
+        if entry.size > self.max_bytes:
+            return
+
+        with self._lock:
+            self._pop(key)
+
+            self._entries[key] = entry
+            self.size += entry.size
+
+            while self.size > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+
+    def delete(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def _pop(self, key):
+        if (entry := self._entries.pop(key, None)) is not None:
+            self.size -= entry.size
+
+def get_cache_key(url, request_headers):
+
+    """ Derive a cache key from a (fully qualified) URL and the request
+    headers. The Authorization header is included, keeping the responses
+    received with different credentials apart.
+    """
+
+    authorization = CaseInsensitiveDict(request_headers).get("Authorization", "")
+    return hashlib.sha256(f"{url}\n{authorization}".encode()).hexdigest()
+
+def _parse_cache_control(headers):
+    directives = {}
+
+    for directive in headers.get("Cache-Control", "").split(","):
+        if m := re.match(r"\s*([\w-]+)\s*(?:=\s*\"?([^\"]*)\"?)?\s*$", directive):
+            directives[m[1].lower()] = m[2]
+
+    return directives
+
+def _get_freshness_lifetime(headers):
+    directives = _parse_cache_control(headers)
+
+    try:
+        age = int(headers.get("Age", 0))
+    except ValueError:
+        age = 0
+
+    if "no-cache" in directives:
+        return 0
+    elif "max-age" in directives:
+        try:
+            return int(directives["max-age"]) - age
+        except (TypeError, ValueError):
+            return 0
+    elif "Expires" in headers:
+        try:
+            expires = parsedate_to_datetime(headers["Expires"]).timestamp()
+        except (TypeError, ValueError):
+            return 0
+
+        return expires - time.time()
+
+    return 0
@@ -0,0 +1,103 @@
+
+""" Load shedding: rejecting requests that have queued for too long before
+reaching a worker, or that exceed a limit of concurrent requests, before
+doing any work on them.
+"""
+
+import logging
+import re
+import threading
+import time
+
+import flask as fl
+
+from pyvoog.configloader import config
+from pyvoog.controller import is_batched_request
+
+QUEUE_START_HEADER = "X-Request-Start"
+
+def shed_load(app, max_queue_time=None, max_concurrent_requests=None):
+
+    """ Call with an application instance to respond with HTTP/503 to
+    requests:
+
+    - having waited in queue for longer than `max_queue_time` seconds (the
+      `max_queue_time` configuration value by default). The time the
+      request was received by the proxy is read from the `X-Request-Start`
+      header, in seconds, milliseconds or microseconds since the epoch,
+      optionally prefixed by `t=` (e.g. as set by `t=${msec}` in nginx).
+    - beyond `max_concurrent_requests` (`max_concurrent_requests`) being
+      serviced concurrently by the process, e.g. by the threads of a
+      threaded worker.
+
+    Rejected requests fail before any authentication or database work, with
+    the response rendered by the application's error handlers. Sub-requests
+    of a batch are never shed, as the batch request already holds a slot
+    and has passed the queue time check.
+    """
+
+    max_queue_time = max_queue_time or config.get("max_queue_time")
+    max_concurrent_requests = max_concurrent_requests or config.get("max_concurrent_requests")
+    semaphore = None
+
+    if max_concurrent_requests:
+        semaphore = threading.BoundedSemaphore(int(max_concurrent_requests))
+
+    def check_queue_time():
+        if is_batched_request():
+            return
+
+        if (queue_time := get_queue_time()) is not None and queue_time > float(max_queue_time):
+            logging.warning(
+                f"Shedding {fl.request.method} {fl.request.path}, queued for {queue_time:.3f}s"
+            )
+
+            fl.abort(503)
+
+    def acquire_slot():
+        if is_batched_request():
+            return
+
+        if not semaphore.acquire(blocking=False):
+            logging.warning(
+                f"Shedding {fl.request.method} {fl.request.path}, "
+                f"{max_concurrent_requests} requests already in progress"
+            )
+
+            fl.abort(503)
+
+        fl.g.holds_request_slot = True
+
+    def release_slot(exc):
+        if fl.g.pop("holds_request_slot", False):
+            semaphore.release()
+
+    if max_queue_time:
+        app.before_request(check_queue_time)
+
+    if semaphore:
+        app.before_request(acquire_slot)
+        app.teardown_request(release_slot)
+
+def get_queue_time():
+
+    """ Return the number of seconds the current request spent in queue as
+    per the `X-Request-Start` header, or None if the header is missing or
+    malformed.
+    """
+
+    header = fl.request.headers.get(QUEUE_START_HEADER, "")
+
+    if not (m := re.match(r"\s*(?:t=)?(\d+(?:\.\d+)?)\s*$", header)):
+        return None
+
+    started_at = float(m[1])
+
+    # Tell apart seconds, milliseconds and microseconds by magnitude.
+
+    if started_at > 1e14:
+        started_at /= 1e6
+    elif started_at > 1e11:
+        started_at /= 1e3
+
+    return max(time.time() - started_at, 0)
@@ -7,6 +7,8 @@ from functools import partial
 
 import flask as fl
 
+from pyvoog.timing import get_timings
+
 class PrefixedLogRecord(logging.LogRecord):
 
     """ A LogRecord subclass providing the `prefix` field containing the
@@ -174,10 +176,23 @@ def log_requests(app, make_log_string=None):
     app.after_request(log_request)
 
 def make_request_log_string(request, response):
-    return (
+
+    """ The default log string of `log_requests`. Includes the durations of
+    request phases in milliseconds if requests are timed (see
+    `pyvoog.timing`).
+    """
+
+    log_string = (
         f"Completed {request.method} {request.path} for {request.remote_addr} "
         f"with {response.status}"
     )
 
+    if timings := get_timings():
+        log_string += " (" + " ".join(
+            f"{phase}={duration * 1000:.1f}ms" for phase, duration in timings.items()
+        ) + ")"
+
+    return log_string
+
 def get_logger_level(name=None):
     return logging.getLogger(name).level
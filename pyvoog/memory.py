@@ -0,0 +1,76 @@
+
+""" Memory usage utilities: determining the resident set size of the
+process and tracking allocation sites growing over time.
+"""
+
+import logging
+import os
+import resource
+import threading
+import tracemalloc
+
+from attrs import define, field
+
+def get_rss():
+
+    """ Return the current resident set size of the process in bytes. Where
+    `/proc` is not available, fall back to the peak resident set size.
+    """
+
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        # `ru_maxrss` is in kilobytes on Linux, but in bytes on macOS.
+
+        return rss if os.uname().sysname == "Darwin" else rss * 1024
+
+@define
+class AllocationTracker:
+
+    """ Sample allocations via tracemalloc, logging the `limit` allocation
+    sites grown the most every `interval` requests, each traced `frames`
+    deep. Call `start` in the process to trace and `record_request` after
+    every request. Note that tracing slows down allocations considerably.
+    """
+
+    interval: int
+    limit: int = 10
+    frames: int = 1
+    _requests: int = field(init=False, default=0)
+    _snapshot: tracemalloc.Snapshot = field(init=False, default=None)
+    _lock: threading.Lock = field(init=False, factory=threading.Lock)
+
+    def start(self):
+        tracemalloc.start(self.frames)
+        self._snapshot = self._take_snapshot()
+
+    def record_request(self):
+
+        """ Count a request and return the statistics of the top allocation
+        sites (also logged) if a report is due, None otherwise.
+        """
+
+        with self._lock:
+            self._requests += 1
+
+            if self._requests % self.interval or not tracemalloc.is_tracing():
+                return None
+
+            (previous_snapshot, self._snapshot) = (self._snapshot, self._take_snapshot())
+
+        stats = self._snapshot.compare_to(previous_snapshot, "lineno")[:self.limit]
+        report = "\n".join(str(stat) for stat in stats)
+
+        logging.info(f"Top allocation sites grown over the last {self.interval} requests:\n{report}")
+
+        return stats
+
+    @staticmethod
+    def _take_snapshot():
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ))
@@ -0,0 +1,357 @@
+
+""" Per-endpoint request metrics, aggregated across the worker processes of
+a server and exposed in the Prometheus text format.
+"""
+
+import glob
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+
+import flask as fl
+
+from pyvoog.configloader import config
+from pyvoog.db import get_engine
+from pyvoog.exceptions import NotInitializedError
+from pyvoog.signals import transaction_retried
+from pyvoog.timing import install_sql_timing
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float("inf"))
+
+# Metric families by name, mapped to their type and help text
+
+FAMILIES = {
+    "pyvoog_http_requests_total": ("counter", "Requests by endpoint, method and status"),
+    "pyvoog_http_request_duration_seconds": ("histogram", "Request latency by endpoint"),
+    "pyvoog_sql_duration_seconds": ("histogram", "Time spent executing SQL per request"),
+    "pyvoog_sql_queries_total": ("counter", "SQL statements executed by endpoint"),
+    "pyvoog_transaction_retries_total": ("counter", "Transactions retried"),
+    "pyvoog_db_pool_connections": ("gauge", "Database connections by state"),
+}
+
+class MetricsStore:
+
+    """ The interface of metrics stores, mapping sample keys (a metric name
+    with labels in the Prometheus text format) to values. Implementations
+    must be thread-safe.
+    """
+
+    def increment(self, key, amount=1):
+        raise NotImplementedError()
+
+    def set(self, key, value):
+        raise NotImplementedError()
+
+    def collect(self):
+
+        """ Return a dict of all sample keys mapped to values. Counters are
+        summed across processes, as are the gauges of live processes.
+        """
+
+        raise NotImplementedError()
+
+class LocalMetricsStore(MetricsStore):
+
+    """ An in-process store, suitable for single-process servers or for
+    observing workers individually.
+    """
+
+    def __init__(self):
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def increment(self, key, amount=1):
+        with self._lock:
+            self._samples[key] = self._samples.get(key, 0) + amount
+
+    def set(self, key, value):
+        with self._lock:
+            self._samples[key] = value
+
+    def collect(self):
+        with self._lock:
+            return self._samples.copy()
+
+class FileMetricsStore(MetricsStore):
+
+    """ A store aggregating metrics across processes. Every process writes
+    its samples into memory-mapped files of its own in `directory`, one for
+    counters and one for gauges, while collecting reads all files. Counters
+    of exited processes keep counting towards the totals, gauges do not.
+
+    The directory should be emptied before starting the server, as not to
+    carry over the counters of a previous run.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._files = {}
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def increment(self, key, amount=1):
+        with self._lock:
+            values = self._get_file("counter")
+            values.write(key, values.read(key) + amount)
+
+    def set(self, key, value):
+        with self._lock:
+            self._get_file("gauge").write(key, value)
+
+    def collect(self):
+        samples = {}
+
+        for path in glob.glob(os.path.join(self.directory, "*.db")):
+            if not (m := re.match(r"(counter|gauge)_(\d+)\.db$", os.path.basename(path))):
+                continue
+            elif m[1] == "gauge" and not _is_process_alive(int(m[2])):
+                continue
+
+            for (key, value, _) in _MmapedValues.read_all(path):
+                samples[key] = samples.get(key, 0) + value
+
+        return samples
+
+    def _get_file(self, kind):
+
+        # Every (possibly forked) process writes into files of its own.
+
+        if (pid := os.getpid()) != self._pid:
+            self._files = {}
+            self._pid = pid
+
+        if kind not in self._files:
+            self._files[kind] = _MmapedValues(os.path.join(self.directory, f"{kind}_{pid}.db"))
+
+        return self._files[kind]
+
+class _MmapedValues:
+
+    """ A dict of float values backed by a memory-mapped file, written by a
+    single process. The file starts with the number of bytes used, followed
+    by entries consisting of the length of the key, the UTF-8 encoded key
+    padded to 8 bytes and the value as a double.
+    """
+
+    INITIAL_SIZE = 64 * 1024
+    HEADER_SIZE = 8
+
+    def __init__(self, path):
+        self._file = open(path, "a+b")
+        self._capacity = max(os.fstat(self._file.fileno()).st_size, self.INITIAL_SIZE)
+        self._file.truncate(self._capacity)
+        self._mmap = mmap.mmap(self._file.fileno(), self._capacity)
+        self._used = struct.unpack_from("<i", self._mmap, 0)[0] or self.HEADER_SIZE
+        self._positions = {key: pos for (key, _, pos) in _iterate_entries(self._mmap, self._used)}
+
+    def read(self, key):
+        if (pos := self._positions.get(key)) is None:
+            return 0
+
+        return struct.unpack_from("<d", self._mmap, pos)[0]
+
+    def write(self, key, value):
+        if (pos := self._positions.get(key)) is None:
+            pos = self._append(key)
+
+        struct.pack_into("<d", self._mmap, pos, value)
+
+    @staticmethod
+    def read_all(path):
+        with open(path, "rb") as f:
+            data = f.read()
+
+        if len(data) < _MmapedValues.HEADER_SIZE:
+            return ()
+
+        return _iterate_entries(data, struct.unpack_from("<i", data, 0)[0])
+
+    def _append(self, key):
+        encoded = key.encode()
+        padding = 8 - (4 + len(encoded)) % 8
+        entry = struct.pack(f"<i{len(encoded) + padding}sd", len(encoded), encoded, 0)
+
+        while self._used + len(entry) > self._capacity:
+            self._grow()
+
+        self._mmap[self._used:self._used + len(entry)] = entry
+        self._used += len(entry)
+
+        # Publish the entry to readers only once it has been written in full.
+
+        struct.pack_into("<i", self._mmap, 0, self._used)
+        self._positions[key] = self._used - 8
+
+        return self._positions[key]
+
+    def _grow(self):
+        self._capacity *= 2
+        self._mmap.close()
+        self._file.truncate(self._capacity)
+        self._mmap = mmap.mmap(self._file.fileno(), self._capacity)
+
+def track_metrics(app, path=None, store=None):
+
+    """ Call with an application instance to record per-endpoint metrics:
+    request counts by status, latency histograms, the time spent executing
+    SQL and the state of the database connection pool. Endpoints are named
+    as per the URL rules (for routed controller actions, by the controller
+    and action names).
+
+    Metrics are exposed in the Prometheus text format on `path`, taken from
+    the `metrics_path` configuration value by default. Nothing is recorded
+    if no path is set. If no store is passed, a FileMetricsStore is used
+    with the directory configured in `metrics_dir`, falling back to a
+    LocalMetricsStore. The endpoint is not authenticated; do not expose it
+    publicly.
+    """
+
+    path = path or config.get("metrics_path")
+
+    if not path:
+        return
+
+    if store is None:
+        directory = config.get("metrics_dir")
+        store = FileMetricsStore(directory) if directory else LocalMetricsStore()
+
+    def start_timer():
+        fl.g.metrics_started_at = time.perf_counter()
+        fl.g.sql_time = 0
+        fl.g.sql_queries = 0
+
+    def record_request(response):
+        if (started_at := fl.g.get("metrics_started_at")) is None:
+            return response
+
+        endpoint = fl.request.endpoint or "unmatched"
+        elapsed = time.perf_counter() - started_at
+
+        store.increment(_make_key(
+            "pyvoog_http_requests_total",
+            endpoint=endpoint, method=fl.request.method, status=response.status_code
+        ))
+
+        _observe(store, "pyvoog_http_request_duration_seconds", elapsed, endpoint=endpoint)
+        _observe(store, "pyvoog_sql_duration_seconds", fl.g.sql_time, endpoint=endpoint)
+        store.increment(_make_key("pyvoog_sql_queries_total", endpoint=endpoint), fl.g.sql_queries)
+
+        _record_pool_stats(store)
+
+        return response
+
+    def record_transaction_retry(sender, **kwargs):
+        store.increment(_make_key("pyvoog_transaction_retries_total"))
+
+    def expose_metrics():
+        return (render_metrics(store.collect()), 200, {"Content-Type": "text/plain; version=0.0.4"})
+
+    install_sql_timing()
+
+    app.before_request(start_timer)
+    app.after_request(record_request)
+    app.add_url_rule(path, endpoint="metrics", view_func=expose_metrics)
+    transaction_retried.connect(record_transaction_retry, weak=False)
+
+def render_metrics(samples):
+
+    """ Render a dict of samples in the Prometheus text format. """
+
+    families = {}
+    lines = []
+
+    for key, value in sorted(samples.items(), key=lambda item: _get_sort_key(item[0])):
+        name = key.split("{")[0]
+        family = re.sub(r"_(bucket|sum|count)$", "", name)
+        family = family if family in FAMILIES else name
+
+        families.setdefault(family, []).append(f"{key} {_format_value(value)}")
+
+    for family, family_lines in families.items():
+        if family in FAMILIES:
+            (type_, help_) = FAMILIES[family]
+            lines += [f"# HELP {family} {help_}", f"# TYPE {family} {type_}"]
+
+        lines += family_lines
+
+    return "\n".join(lines) + "\n"
+
+def _get_sort_key(key):
+
+    # Order the buckets of a histogram numerically by their upper bound
+    # (with +Inf last), rather than lexically.
+
+    if not (m := re.search(r'(,?)le="([^"]*)"(,?)', key)):
+        return (key, 0)
+
+    separator = "," if m[1] and m[3] else ""
+
+    return (key[:m.start()] + separator + key[m.end():], float(m[2]))
+
+def _format_value(value):
+
+    # Render integral values exactly, others with full float precision.
+
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+def _make_key(name, **labels):
+    if not labels:
+        return name
+
+    label_str = ",".join(f'{k}="{_escape_label_value(v)}"' for k, v in sorted(labels.items()))
+
+    return f"{name}{{{label_str}}}"
+
+def _escape_label_value(value):
+    return str(value).replace("\\", r"\\").replace("\"", r"\"").replace("\n", r"\n")
+
+def _observe(store, name, value, **labels):
+
+    # Increment every bucket, if only by zero, as for all buckets of a label
+    # set to be exposed from its first observation on.
+
+    for bound in LATENCY_BUCKETS:
+        le = "+Inf" if bound == float("inf") else f"{bound:g}"
+        store.increment(_make_key(f"{name}_bucket", le=le, **labels), int(value <= bound))
+
+    store.increment(_make_key(f"{name}_sum", **labels), value)
+    store.increment(_make_key(f"{name}_count", **labels))
+
+def _record_pool_stats(store):
+    try:
+        pool = get_engine().pool
+    except NotInitializedError:
+        return
+
+    if not hasattr(pool, "checkedout"):
+        return
+
+    store.set(_make_key("pyvoog_db_pool_connections", state="checked_out"), pool.checkedout())
+    store.set(_make_key("pyvoog_db_pool_connections", state="idle"), pool.checkedin())
+    store.set(_make_key("pyvoog_db_pool_connections", state="overflow"), max(pool.overflow(), 0))
+
+def _is_process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+
+    return True
+
+def _iterate_entries(data, used):
+    pos = _MmapedValues.HEADER_SIZE
+
+    while pos < used:
+        (key_len,) = struct.unpack_from("<i", data, pos)
+        key = bytes(data[pos + 4:pos + 4 + key_len]).decode()
+        pos += 4 + key_len + 8 - (4 + key_len) % 8
+
+        yield (key, struct.unpack_from("<d", data, pos)[0], pos)
+
+        pos += 8
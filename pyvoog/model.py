@@ -9,7 +9,7 @@ from marshmallow import Schema, fields, validate
 from sqlalchemy.event import listen
 from sqlalchemy.ext.declarative import DeclarativeMeta
 from sqlalchemy.ext.mutable import MutableDict
-from sqlalchemy import Column, inspect, select, types as sa_types
+from sqlalchemy import Column, Index, Table, inspect, select, types as sa_types
 from sqlalchemy.orm import declared_attr, declarative_base, object_session
 from sqlalchemy.sql import func
 from sqlalchemy.sql.sqltypes import Boolean, Integer, JSON, String
@@ -17,6 +17,7 @@ from stringcase import snakecase
 
 from pyvoog.db import get_session
 from pyvoog.exceptions import ValidationError
+from pyvoog.timing import timed
 from pyvoog.util import Undefined
 from pyvoog.validatable import Validatable
 
@@ -84,6 +85,8 @@ class SchemalessColumn(Column):
     (unstructured data).
     """
 
+    inherit_cache = True
+
     def __init__(self, **kwargs):
         super().__init__(MutableDict.as_mutable(JSON), **kwargs)
 
@@ -139,8 +142,17 @@ class VirtualAttribute(Validatable):
         return self.attr_name
 
     def __get__(self, obj, objtype=None):
+        return self.lookup(getattr(obj, self.schemaless_field))
+
+    def lookup(self, data):
+
+        """ Look up the attribute in `data` (the contents of the backing
+        schemaless column), falling back to the default. Used directly when
+        reading plain rows instead of model instances.
+        """
+
         try:
-            return getattr(obj, self.schemaless_field)[self.attr_name]
+            return data[self.attr_name]
         except (KeyError, TypeError):
             if self.default == Undefined:
                 raise
@@ -165,7 +177,9 @@ class UTCTimeStamp(sa_types.TypeDecorator):
     all time zone information, hence always storing timestamps as UTC is a
     workaround to that issue. Incoming values are required to be aware, i.e.
     to contain time zone information. Pass `UTCTimeStamp.NOW` to set the
-    timestamp to the current date and time.
+    timestamp to the current date and time. `UTCTimeStamp.now` is the
+    equivalent for column defaults, also populating the attribute on the
+    instance with the actual timestamp.
 
     See:
 
@@ -178,9 +192,13 @@ class UTCTimeStamp(sa_types.TypeDecorator):
     impl = sa_types.DateTime
     cache_ok = True
 
+    @staticmethod
+    def now():
+        return datetime.now(tz=timezone.utc).replace(microsecond=0)
+
     def process_bind_param(self, value: datetime, dialect):
         if value == self.NOW:
-            value = datetime.now(tz=timezone.utc).replace(microsecond=0)
+            value = self.now()
         elif not isinstance(value, datetime) or not value.tzinfo:
             raise TypeError("UTCTimeStamp values must be aware `datetime` objects")
 
@@ -197,10 +215,13 @@ class ModelMetaclass(DeclarativeMeta):
     """ Model base metaclass. """
 
     def __init__(cls, *args, **kwargs):
+        cls._declare_version()
+
         super().__init__(*args, **kwargs)
 
         cls._set_va_attr_names()
         cls._declare_timestamps()
+        cls._declare_tombstones()
         cls._attach_init_listener()
 
     def _set_va_attr_names(cls):
@@ -214,11 +235,71 @@ class ModelMetaclass(DeclarativeMeta):
             v._set_attr_name(k)
 
     def _declare_timestamps(cls):
-        if not getattr(cls, "include_timestamps", False):
+
+        """ Declare the `created_at` and `updated_at` columns if the model
+        has `include_timestamps` or `include_changes_feed` set. The latter
+        also declares an `(updated_at, id)` index for the changes feed (see
+        `Controller.paginate_changes`).
+        """
+
+        include_changes_feed = getattr(cls, "include_changes_feed", False)
+
+        if not getattr(cls, "include_timestamps", False) and not include_changes_feed:
+            return
+
+        cls.created_at = Column(UTCTimeStamp(), default=UTCTimeStamp.now)
+        cls.updated_at = Column(UTCTimeStamp(), default=UTCTimeStamp.now, onupdate=UTCTimeStamp.now)
+
+        if include_changes_feed:
+            Index(f"ix_{cls.__tablename__}_updated_at_id", cls.__table__.c.updated_at, cls.id)
+
+    def _declare_tombstones(cls):
+
+        """ Declare the tombstone table of the model, `<table>_tombstone`,
+        and record a tombstone whenever an object is deleted via the ORM. A
+        tombstone holds the ID of the deleted object, the time of deletion
+        and a copy of every column named in `tombstone_columns`. The latter
+        must include all columns filtered on by the default scope.
+        """
+
+        if not getattr(cls, "include_tombstones", False):
+            return
+
+        copied_columns = (
+            Column(name, cls.__table__.c[name].type)
+            for name in getattr(cls, "tombstone_columns", ())
+        )
+
+        cls.__tombstone_table__ = Table(
+            f"{cls.__tablename__}_tombstone",
+            cls.metadata,
+            Column("id", Integer, nullable=False),
+            Column("deleted_at", UTCTimeStamp(), nullable=False),
+            *copied_columns,
+        )
+
+        Index(
+            f"ix_{cls.__tablename__}_tombstone_deleted_at_id",
+            cls.__tombstone_table__.c.deleted_at,
+            cls.__tombstone_table__.c.id,
+        )
+
+        listen(cls, "after_delete", cls._record_tombstone)
+
+    def _declare_version(cls):
+
+        """ Declare the `version` column and configure it as the version
+        counter of the mapper, enabling optimistic concurrency control. Has to
+        happen before the class is mapped. See also:
+
+        https://docs.sqlalchemy.org/en/20/orm/versioning.html
+        """
+
+        if not getattr(cls, "include_version", False):
             return
 
-        cls.created_at = Column(UTCTimeStamp(), default=UTCTimeStamp.NOW)
-        cls.updated_at = Column(UTCTimeStamp(), default=UTCTimeStamp.NOW, onupdate=UTCTimeStamp.NOW)
+        cls.version = Column(Integer)
+        cls.__mapper_args__ = getattr(cls, "__mapper_args__", {}) | {"version_id_col": cls.version}
 
     def _attach_init_listener(cls):
 
@@ -247,6 +328,17 @@ class Model:
       attributes to pass to SQLAlchemy's `filter_by`. A statement with the
       scope applied can be retrieved via the `get_scoped_query` method or
       the `scoped_query` property.
+    - Changes feeds. If a model class has `include_changes_feed` set, it is
+      timestamped and indexed by `(updated_at, id)` for polling changes
+      (see `Controller.paginate_changes`).
+    - Tombstones. If a model class has `include_tombstones` set, deletions
+      are recorded in a tombstone table, allowing changes feeds to report
+      these (see `ModelMetaclass._declare_tombstones`). `get_tombstone_query`
+      returns a statement over the tombstones in the default scope.
+    - Row projections. `get_row_query` returns a statement selecting plain
+      table columns and `row_as_dict` turns a resulting row into a dict
+      identical to the output of `as_dict`, without constructing model
+      instances. Useful for read-only paths serializing many objects.
 
     Model attributes may either have a 1:1 mapping to database columns
     (`sqlalchemy.Column` or its subclasses) or be VirtualAttributes which
@@ -307,6 +399,104 @@ class Model:
 
         return cls._apply_default_scope_to_stmt(cls.get_unscoped_statement(verb, *args))
 
+    @classmethod
+    def get_row_query(cls):
+
+        """ Return a Select of all table columns (as opposed to the mapped
+        entity) with the default scope applied. Execute and pass resulting
+        rows to `row_as_dict`.
+        """
+
+        return cls._apply_default_scope_to_stmt(select(*cls.__table__.c))
+
+    @classmethod
+    def get_tombstone_query(cls):
+
+        """ Return a Select of the model's tombstones with the default scope
+        applied.
+        """
+
+        return cls._apply_default_scope_to_stmt(select(cls.__tombstone_table__))
+
+    @classmethod
+    def prune_tombstones(cls, deleted_before, session=None):
+
+        """ Delete tombstones of objects deleted before `deleted_before`, an
+        aware datetime. Clients last synced before that must resynchronize
+        fully, as the deletions are no longer reported to these. Any session
+        may be passed in, by default the per-request session is used.
+        """
+
+        table = cls.__tombstone_table__
+
+        (session or get_session()).execute(
+            table.delete().where(table.c.deleted_at < deleted_before)
+        )
+
+    @classmethod
+    def row_as_dict(cls, row):
+
+        """ The counterpart of `as_dict` for Core rows produced by executing
+        `get_row_query` (or any statement selecting all table columns).
+        Virtual attributes are expanded from their backing schemaless column.
+        """
+
+        mapping = row._mapping
+        vattrs = {vattr.name: vattr for vattr in cls._get_vattrs()}
+        attrs = {}
+
+        for k in cls.__schema__().fields:
+            if vattr := vattrs.get(k):
+                attrs[k] = vattr.lookup(mapping[vattr.schemaless_field])
+            else:
+                attrs[k] = mapping[k]
+
+        return {"id": mapping["id"], **attrs}
+
+    @classmethod
+    def iterate(cls, batch_size=1000, where=None, keyset=False, session=None):
+
+        """ Iterate over all objects in the default scope in ID order, loading
+        `batch_size` objects at a time. `where` is an optional criterion
+        further narrowing the query. Objects of a batch are expunged from the
+        session once the batch has been consumed (after flushing any pending
+        changes), keeping memory usage bounded. If iteration is abandoned
+        midway (e.g. by breaking out of the loop), objects of the current
+        batch are expunged without flushing, save for those with pending
+        changes. Any session may be passed in, by default the per-request
+        session is used.
+
+        By default, the query is streamed via a server-side cursor on dialects
+        supporting these. The cursor is held open for the whole iteration and
+        the transaction must not be committed before iteration is over. If
+        `keyset` is true, every batch is instead fetched by a separate query
+        starting after the last seen ID, allowing committing between batches.
+        """
+
+        session = session or get_session()
+        query = cls.get_query().order_by(cls.id)
+
+        if where is not None:
+            query = query.where(where)
+
+        if keyset:
+            batches = cls._iterate_batches_by_keyset(session, query, batch_size)
+        else:
+            result = session.execute(query.execution_options(yield_per=batch_size))
+            batches = result.scalars().partitions()
+
+        for batch in batches:
+            flushed = False
+
+            try:
+                yield from batch
+
+                session.flush()
+                flushed = True
+            finally:
+                cls._expunge_batch(session, batch, flushed)
+
+    @timed("validation")
     def validate(self):
         schema = self.__class__.__schema__()
         attrs = self._get_attr_dict()
@@ -355,6 +545,45 @@ class Model:
 
         return stmt
 
+    @classmethod
+    def _iterate_batches_by_keyset(cls, session, query, batch_size):
+        last_id = None
+
+        while True:
+            batch_query = query if last_id is None else query.where(cls.id > last_id)
+            batch = session.execute(batch_query.limit(batch_size)).scalars().all()
+
+            if not batch:
+                break
+
+            last_id = batch[-1].id
+
+            yield batch
+
+    @classmethod
+    def _record_tombstone(cls, mapper, connection, target):
+        table = cls.__tombstone_table__
+        copied_values = {
+            c.name: getattr(target, c.name) for c in table.c if c.name not in ("id", "deleted_at")
+        }
+
+        connection.execute(
+            table.insert().values(id=target.id, deleted_at=UTCTimeStamp.now(), **copied_values)
+        )
+
+    @staticmethod
+    def _expunge_batch(session, batch, flushed):
+
+        # Objects deleted (and committed) by the caller are no longer in the
+        # session. Unless flushed, objects with pending changes are kept, as
+        # not to discard these.
+
+        pending = set() if flushed else set(session.dirty) | set(session.deleted)
+
+        for obj in batch:
+            if obj in session and obj not in pending:
+                session.expunge(obj)
+
     def _run_attr_validations(self):
         columns = inspect(self.__class__).c
         vattrs = self._get_vattrs()
@@ -366,10 +595,11 @@ class Model:
                 except ValidationError as e:
                     yield (c.name, e.messages)
 
-    def _get_vattrs(self):
+    @classmethod
+    def _get_vattrs(cls):
         return filter(
             lambda attr: isinstance(attr, VirtualAttribute),
-            self.__class__.__dict__.values()
+            cls.__dict__.values()
         )
 
     def _get_attr_dict(self):
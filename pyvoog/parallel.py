@@ -0,0 +1,176 @@
+
+""" Facilities for processing model data in parallel across worker
+processes.
+"""
+
+import logging
+import os
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from attrs import define
+
+from pyvoog.db import dispose_engine, get_engine, setup_database, temporary_session
+
+@define
+class ChunkOutcome:
+
+    """ The outcome of processing a chunk of objects: the IDs in the chunk,
+    the return value of the processing function or the exception raised by
+    the last attempt, and the number of attempts made.
+    """
+
+    ids: list
+    result: object = None
+    error: Exception = None
+    attempts: int = 0
+
+    @property
+    def failed(self):
+        return self.error is not None
+
+def process_in_parallel(
+    model, fn, query=None, chunk_size=1000, max_workers=None, retries=2, on_progress=None,
+    db_url=None
+):
+
+    """ Split the objects matched by `query` (`model.get_query()` by default)
+    into chunks of `chunk_size` consecutive IDs and process these in a pool
+    of `max_workers` processes (the CPU count by default). Return a list of
+    ChunkOutcomes in ID order.
+
+    `fn` is invoked in a worker process with a session and the list of
+    objects in a chunk. The session is committed after `fn` returns and its
+    return value is recorded in the chunk's outcome. Failed chunks are
+    retried up to `retries` times; the final error of a chunk that could not
+    be processed is recorded in its outcome instead of being raised. If
+    passed, `on_progress` is invoked in the parent process with every
+    completed ChunkOutcome.
+
+    If a worker process dies (e.g. killed for running out of memory), the
+    pool is replaced by a new one. As the chunk that caused it cannot be
+    told apart, every chunk in flight at the time counts the failure as an
+    attempt.
+
+    Every worker sets up an engine of its own, connecting to `db_url` (the
+    URL of the engine set up by `setup_database` by default). Note that
+    `model` and `fn` are passed to workers by reference and must hence be
+    importable module-level objects.
+    """
+
+    db_url = db_url or get_engine().url.render_as_string(hide_password=False)
+    max_workers = max_workers or os.cpu_count()
+    outcomes = []
+    pending = {}
+    executor = None
+
+    def make_executor():
+        return ProcessPoolExecutor(
+            max_workers=max_workers, initializer=_init_worker, initargs=(db_url,)
+        )
+
+    def submit(outcome):
+        nonlocal executor
+
+        outcome.attempts += 1
+
+        try:
+            future = executor.submit(_process_chunk, model, outcome.ids, fn)
+        except BrokenProcessPool:
+            logging.warning("A worker process died, replacing the process pool")
+
+            executor.shutdown(wait=False)
+            executor = make_executor()
+            future = executor.submit(_process_chunk, model, outcome.ids, fn)
+
+        pending[future] = outcome
+
+    def collect(futures):
+        for future in futures:
+            outcome = pending.pop(future)
+
+            try:
+                outcome.result = future.result()
+                outcome.error = None
+            except Exception as e:
+                outcome.error = e
+
+                if outcome.attempts <= retries:
+                    logging.warning(
+                        f"Processing {model.__name__} chunk starting at ID {outcome.ids[0]} "
+                        f"failed (attempt {outcome.attempts}), retrying: {e}"
+                    )
+
+                    submit(outcome)
+                    continue
+
+            logging.debug(f"Processed {model.__name__} chunk starting at ID {outcome.ids[0]}")
+
+            if on_progress:
+                on_progress(outcome)
+
+    executor = make_executor()
+
+    try:
+        for ids in _get_id_chunks(model, query, chunk_size):
+            outcome = ChunkOutcome(ids=ids)
+
+            outcomes.append(outcome)
+            submit(outcome)
+
+            # Bound the number of chunks in flight, as not to enumerate the
+            # entire table up front.
+
+            while len(pending) >= max_workers * 2:
+                collect(wait(pending, return_when=FIRST_COMPLETED).done)
+
+        while pending:
+            collect(wait(pending, return_when=FIRST_COMPLETED).done)
+    finally:
+        executor.shutdown()
+
+    return outcomes
+
+def _get_id_chunks(model, query, chunk_size):
+
+    """ Enumerate IDs chunk by chunk, each by a separate keyset query, as
+    not to hold a transaction open in the parent while workers are writing.
+    """
+
+    query = model.get_query() if query is None else query
+    id_query = query.with_only_columns(model.id).order_by(None).order_by(model.id)
+    last_id = None
+
+    with temporary_session() as session:
+        while True:
+            chunk_query = id_query if last_id is None else id_query.where(model.id > last_id)
+            ids = session.execute(chunk_query.limit(chunk_size)).scalars().all()
+
+            session.rollback()
+
+            if not ids:
+                break
+
+            last_id = ids[-1]
+
+            yield ids
+
+def _init_worker(db_url):
+
+    """ Set up an engine in a freshly started worker. An engine inherited
+    from a forked parent is discarded without closing its connections, as
+    these are still in use by the parent.
+    """
+
+    dispose_engine(close=False)
+    setup_database(db_url)
+
+def _process_chunk(model, ids, fn):
+    with temporary_session() as session:
+        query = model.get_unscoped_query().where(model.id.in_(ids)).order_by(model.id)
+        result = fn(session, session.execute(query).scalars().all())
+
+        session.commit()
+
+        return result
@@ -0,0 +1,126 @@
+
+""" On-demand profiling of individual requests, either sampled at a fixed
+rate or triggered by a signed request header.
+"""
+
+import cProfile
+import logging
+import os
+import random
+import threading
+import time
+
+import flask as fl
+import jwt as pyjwt
+
+from pyvoog.configloader import config
+
+try:
+    import pyinstrument
+
+    from pyinstrument.renderers import SpeedscopeRenderer
+except ImportError:
+    pyinstrument = None
+
+PROFILE_HEADER = "X-Profile-Token"
+
+# Only one profiler may be active in a process at a time.
+
+_profiler_lock = threading.Lock()
+
+def profile_requests(app, directory=None, sample_rate=None, secret=None):
+
+    """ Call with an application instance to profile requests, writing the
+    results into `directory` (the `profile_dir` configuration value by
+    default). Nothing is profiled if no directory is set. A request is
+    profiled if either:
+
+    - a random sample falls within `sample_rate` (`profile_sample_rate`), a
+      fraction between 0 and 1, or
+    - it carries a JWT signed with `secret` (`profile_secret`) on the
+      `X-Profile-Token` header. The `exp` claim is required. Unsigned
+      headers are ignored.
+
+    Requests are profiled with pyinstrument, a sampling profiler, if it is
+    installed, and the results are written as speedscope files. Otherwise
+    cProfile is used and pstats files are written. Files are named by the
+    endpoint, time (in milliseconds) and process ID. While a request is
+    being profiled, concurrent requests in the same process are not.
+    """
+
+    directory = directory or config.get("profile_dir")
+    sample_rate = float(sample_rate or config.get("profile_sample_rate") or 0)
+    secret = secret or config.get("profile_secret")
+
+    if not directory:
+        return
+
+    os.makedirs(directory, exist_ok=True)
+
+    def start_profiling():
+        if not (_is_sampled(sample_rate) or _has_valid_token(secret)):
+            return
+        elif not _profiler_lock.acquire(blocking=False):
+            return
+
+        try:
+            fl.g.profiler = _start_profiler()
+        except Exception:
+            _profiler_lock.release()
+            raise
+
+    def stop_profiling(exc):
+        if (profiler := fl.g.pop("profiler", None)) is None:
+            return
+
+        try:
+            path = _stop_profiler(profiler, directory, fl.request.endpoint or "unmatched")
+        finally:
+            _profiler_lock.release()
+
+        logging.info(f"Wrote the profile of {fl.request.method} {fl.request.path} to {path}")
+
+    app.before_request(start_profiling)
+    app.teardown_request(stop_profiling)
+
+def _is_sampled(sample_rate):
+    return sample_rate > 0 and random.random() < sample_rate
+
+def _has_valid_token(secret):
+    if not secret or not (token := fl.request.headers.get(PROFILE_HEADER)):
+        return False
+
+    try:
+        pyjwt.decode(token, secret, algorithms="HS256", options=dict(require=["exp"]))
+    except Exception as e:
+        logging.warning(f"Ignoring invalid profiling token: {e}")
+        return False
+
+    return True
+
+def _start_profiler():
+    if pyinstrument:
+        profiler = pyinstrument.Profiler(async_mode="disabled")
+        profiler.start()
+    else:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    return profiler
+
+def _stop_profiler(profiler, directory, endpoint):
+    basename = os.path.join(directory, f"{endpoint}-{int(time.time() * 1000)}-{os.getpid()}")
+
+    if pyinstrument:
+        profiler.stop()
+        path = f"{basename}.speedscope.json"
+
+        with open(path, "w") as f:
+            f.write(profiler.output(SpeedscopeRenderer()))
+    else:
+        profiler.disable()
+        path = f"{basename}.pstats"
+
+        profiler.dump_stats(path)
+
+    return path
@@ -0,0 +1,111 @@
+
+""" Token bucket rate limiting of API consumers, keyed by a claim of the
+JWT authenticating the request.
+"""
+
+import threading
+import time
+
+from attrs import Factory, define, field
+
+@define(frozen=True)
+class RateLimit:
+
+    """ A token bucket allowing `rate` requests per second on average and
+    bursts of up to `burst` requests (by default, a second's worth of
+    requests). Requests are counted separately for every value of the JWT
+    claim `claim`, the subject by default.
+    """
+
+    rate: float
+    burst: float = field(default=Factory(lambda self: max(self.rate, 1), takes_self=True))
+    claim: str = "sub"
+
+class RateLimitStore:
+
+    """ The interface of token bucket stores. Implementations must be
+    thread-safe. A store shared across processes (e.g. backed by Redis)
+    enforces limits server-wide, while an in-process store enforces these
+    per worker process.
+    """
+
+    def consume(self, key, limit):
+
+        """ Take a token from the bucket of `key`, governed by the RateLimit
+        `limit`. Return 0 if a token was available, otherwise the number of
+        seconds until one will be.
+        """
+
+        raise NotImplementedError()
+
+class LocalRateLimitStore(RateLimitStore):
+
+    """ An in-process store. Buckets are guarded by a fixed set of locks
+    picked by key, so that concurrent requests of different consumers
+    rarely contend. Once more than `max_keys` buckets are tracked, the
+    store is swept at most every SWEEP_INTERVAL seconds (or immediately,
+    past twice the limit): full buckets are discarded, as these are
+    indistinguishable from new ones, followed by the least recently used
+    buckets until at most `max_keys` remain.
+    """
+
+    LOCK_COUNT = 64
+    SWEEP_INTERVAL = 1
+
+    def __init__(self, max_keys=100_000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._locks = tuple(threading.Lock() for _ in range(self.LOCK_COUNT))
+        self._sweep_lock = threading.Lock()
+        self._swept_at = 0
+
+    def consume(self, key, limit):
+        now = time.monotonic()
+        key_count = len(self._buckets)
+
+        if key_count > self.max_keys and (
+            now - self._swept_at >= self.SWEEP_INTERVAL or key_count > self.max_keys * 2
+        ):
+            self._sweep(now)
+
+        with self._locks[hash(key) % self.LOCK_COUNT]:
+
+            # Buckets are reinserted on every update, keeping the dict in
+            # least recently used order.
+
+            (tokens, _, updated_at) = self._buckets.pop(key, (limit.burst, limit, now))
+            tokens = min(limit.burst, tokens + (now - updated_at) * limit.rate)
+
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, limit, now)
+                return 0
+
+            self._buckets[key] = (tokens, limit, now)
+
+            return (1 - tokens) / limit.rate
+
+    def _sweep(self, now):
+        if not self._sweep_lock.acquire(blocking=False):
+            return
+
+        try:
+            self._swept_at = now
+            keys = list(self._buckets)
+
+            for key in keys:
+                with self._locks[hash(key) % self.LOCK_COUNT]:
+                    (tokens, limit, updated_at) = self._buckets.get(key, (0, None, now))
+
+                    if limit and tokens + (now - updated_at) * limit.rate >= limit.burst:
+                        del self._buckets[key]
+
+            for key in keys:
+                if len(self._buckets) <= self.max_keys:
+                    break
+
+                with self._locks[hash(key) % self.LOCK_COUNT]:
+                    self._buckets.pop(key, None)
+        finally:
+            self._sweep_lock.release()
+
+default_store = LocalRateLimitStore()
@@ -7,6 +7,8 @@ import flask as fl
 from attrs import define
 from stringcase import snakecase
 
+from pyvoog.controller import BatchController
+
 from .endpoint import Endpoint
 from .namespace import Namespace
 from .resource import Resource
@@ -14,7 +16,22 @@ from .util import normalize_path
 
 @define
 class Router:
+
+    """ Routes requests to the controllers in the `controller_ns` package
+    (see `route`).
+
+    If `batch_path` is set, a batch endpoint multiplexing several requests
+    in one is set up at this path, authenticated by JWTs signed with
+    `batch_jwt_secret` and accepting batches of up to
+    `batch_max_requests` requests, run concurrently in up to
+    `batch_max_workers` threads if so requested (see BatchController).
+    """
+
     controller_ns: str
+    batch_path: str = None
+    batch_jwt_secret: str = None
+    batch_max_requests: int = 50
+    batch_max_workers: int = 8
 
     DEFAULT_ENDPOINTS_TEMPLATE = [
         dict(path="{}s", methods=["GET"], action="index"),
@@ -58,6 +75,9 @@ class Router:
             for resource in resources:
                 self._route_resource(path_prefix, resource)
 
+        if self.batch_path:
+            self._route_batch_endpoint()
+
     def _route_resource(self, path_prefix, resource):
         if not isinstance(resource, Resource):
             raise TypeError(
@@ -80,6 +100,21 @@ class Router:
 
             self._route_to_controller(controller, path_prefix, endpoint)
 
+    def _route_batch_endpoint(self):
+        if not self.batch_jwt_secret:
+            raise ValueError("`batch_jwt_secret` is required if `batch_path` is set")
+
+        controller = BatchController(
+            jwt_secret=self.batch_jwt_secret,
+            max_requests=self.batch_max_requests,
+            max_workers=self.batch_max_workers,
+        )
+
+        if "batch_controller_dispatch" not in fl.current_app.view_functions:
+            self._route_to_controller(
+                controller, "/", Endpoint(self.batch_path, "dispatch", methods=["POST"])
+            )
+
     def _route_to_controller(self, controller, path_prefix, endpoint):
 
         """ Route paths (path prefix + endpoint path) to controller actions. """
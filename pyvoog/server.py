@@ -3,13 +3,56 @@
 line options for configuration.
 """
 
+import functools
+import gc
+import logging
+
 from gunicorn.app.base import BaseApplication as GunicornBaseApplication
 from gunicorn.config import Config as GunicornConfig
+from sqlalchemy.orm import configure_mappers
+
+from pyvoog.db import dispose_engine
+from pyvoog.memory import AllocationTracker, get_rss
+from pyvoog.user_agent import discard_shared_sessions
 
 class Server(GunicornBaseApplication):
-    def __init__(self, app, argv):
+
+    """ Tuning profiles (see `pyvoog.server_profiles`) are resolved into
+    `argv` by `Args.gunicorn_argv`. Applications not using `Args` may
+    prepend `get_tuning_argv(get_profile_settings(profile))` to `argv`
+    likewise.
+
+    If `preload` is true (or `--preload` is passed to Gunicorn), the
+    application is loaded in the master process before forking workers. All
+    SQLAlchemy mappers (and thereby model schemas) are configured up front
+    and the objects allocated so far are frozen out of the reach of the
+    garbage collector, so that workers share their memory copy-on-write
+    instead of dirtying it on the first collection.
+
+    In every worker, the database connection pool and the pooled upstream
+    connections of UserAgents inherited from the master are discarded after
+    forking, so that workers never share sockets.
+
+    Memory usage is bounded by the following options:
+
+    - max_worker_rss - Gracefully restart a worker once its resident set
+      size exceeds this many megabytes, checked after every request.
+    - trace_allocations - Trace allocations in workers and log the top
+      allocation sites grown every this many requests (see
+      `AllocationTracker`). Meant for hunting down leaks, as tracing incurs
+      a considerable overhead.
+    """
+
+    def __init__(
+        self, app, argv, preload=False, max_worker_rss=None, trace_allocations=None
+    ):
         self.application = app
         self.argv = argv
+        self.preload = preload
+        self.max_worker_rss = max_worker_rss
+        self.allocation_tracker = (
+            AllocationTracker(interval=trace_allocations) if trace_allocations else None
+        )
 
         super().__init__()
 
@@ -17,9 +60,70 @@ class Server(GunicornBaseApplication):
         parser = GunicornConfig(prog="(gunicorn options)").parser()
         args = parser.parse_args(self.argv)
 
+        if self.preload:
+            self.cfg.set("preload_app", True)
+
         for k, v in vars(args).items():
             if v is not None and k != "args":
                 self.cfg.set(k, v)
 
+        self._chain_hook("pre_fork", self._freeze_objects)
+        self._chain_hook("post_fork", self._reset_after_fork)
+        self._chain_hook("post_request", self._check_memory)
+
     def load(self):
+        if self.cfg.preload_app:
+            self._warm_up()
+
         return self.application
+
+    def _chain_hook(self, name, fn):
+
+        """ Install a server hook, calling any hook already configured (e.g.
+        in a Gunicorn config file) first.
+        """
+
+        configured_hook = getattr(self.cfg, name)
+
+        # Wrap `fn` as to have Gunicorn validate the arity of the hook by its
+        # signature.
+
+        @functools.wraps(fn)
+        def hook(*args):
+            configured_hook(*args)
+            fn(*args)
+
+        self.cfg.set(name, hook)
+
+    @staticmethod
+    def _warm_up():
+        logging.info("Preloading the application in the master process")
+
+        configure_mappers()
+        gc.collect()
+
+    def _freeze_objects(self, server, worker):
+        if self.cfg.preload_app:
+            gc.freeze()
+
+    def _reset_after_fork(self, server, worker):
+        dispose_engine(close=False)
+        discard_shared_sessions()
+
+        if self.allocation_tracker:
+            self.allocation_tracker.start()
+
+    def _check_memory(self, worker, req, environ, resp):
+        if self.allocation_tracker:
+            self.allocation_tracker.record_request()
+
+        if not self.max_worker_rss or not worker.alive:
+            return
+
+        if (rss := get_rss()) > self.max_worker_rss * 1024 * 1024:
+            logging.warning(
+                f"Worker {worker.pid} RSS of {rss / (1024 * 1024):.1f} MB exceeds "
+                f"{self.max_worker_rss} MB, restarting"
+            )
+
+            worker.alive = False
@@ -0,0 +1,78 @@
+
+""" Gunicorn tuning profiles, deriving worker settings from the number of
+available CPUs. Kept free of dependencies, so that command-line parsing
+need not import the server.
+"""
+
+import os
+
+PROFILES = ("cpu-bound", "balanced", "io-bound")
+WORKER_CLASSES = ("sync", "gthread", "gevent")
+
+# Tuning settings mapped to Gunicorn options
+
+TUNING_OPTIONS = dict(
+    worker_class="--worker-class",
+    workers="--workers",
+    threads="--threads",
+    keepalive="--keep-alive",
+    backlog="--backlog",
+    max_requests="--max-requests",
+    max_requests_jitter="--max-requests-jitter",
+)
+
+def get_profile_settings(profile, cpu_count=None):
+
+    """ Return a dict of Gunicorn settings for a tuning profile:
+
+    - cpu-bound - A sync worker per CPU plus one. For applications spending
+      most of their time computing, where threads would only contend for the
+      GIL.
+    - balanced - Two threaded workers per CPU plus one, with two threads
+      each. A reasonable default for typical database-backed APIs.
+    - io-bound - A threaded worker per CPU (at least two) with eight threads
+      each. For applications spending most of their time waiting on
+      upstream services or the database.
+
+    All profiles recycle workers after about 10000 requests, jittered as not
+    to restart all workers at once.
+    """
+
+    cpus = cpu_count or _get_cpu_count()
+    settings = dict(backlog=2048, max_requests=10000, max_requests_jitter=1000)
+
+    if profile == "cpu-bound":
+        settings |= dict(worker_class="sync", workers=cpus + 1, threads=1, keepalive=2)
+    elif profile == "balanced":
+        settings |= dict(worker_class="gthread", workers=cpus * 2 + 1, threads=2, keepalive=5)
+    elif profile == "io-bound":
+        settings |= dict(worker_class="gthread", workers=max(cpus, 2), threads=8, keepalive=5)
+    else:
+        raise ValueError(f"Unknown tuning profile: {profile}")
+
+    return settings
+
+def get_tuning_argv(settings):
+
+    """ Translate a dict of tuning settings to Gunicorn arguments, skipping
+    settings set to None.
+    """
+
+    argv = []
+
+    for k, v in settings.items():
+        if v is not None:
+            argv += [TUNING_OPTIONS[k], str(v)]
+
+    return argv
+
+def _get_cpu_count():
+
+    """ Return the number of CPUs available to the process, honoring CPU
+    affinity (e.g. as set up by container runtimes) where supported.
+    """
+
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
@@ -3,3 +3,4 @@ from blinker import Namespace
 _signals = Namespace()
 
 jwt_decoded = _signals.signal('jwt_decoded')
+transaction_retried = _signals.signal('transaction_retried')
@@ -0,0 +1,195 @@
+
+""" Incremental parsing of large request bodies: NDJSON documents and JSON
+arrays, yielding one item at a time while holding at most a single item
+(plus a read chunk) in memory.
+"""
+
+import codecs
+import json
+import re
+
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+
+NDJSON_MIMETYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+DEFAULT_MAX_ITEM_SIZE = 1024 * 1024
+
+_NUMBER_CHARS_REGEX = re.compile(r"[\d.eE+-]*")
+
+def iterate_items(
+    stream, mimetype, max_items=None, max_item_size=DEFAULT_MAX_ITEM_SIZE, max_size=None,
+    chunk_size=DEFAULT_CHUNK_SIZE
+):
+
+    """ Return an iterator over the items of the body read from `stream`:
+    the lines of an NDJSON document if `mimetype` is an NDJSON MIME type,
+    otherwise the elements of a JSON array. Raise RequestEntityTooLarge once
+    more than `max_items` items, an item larger than `max_item_size`
+    characters or a body larger than `max_size` bytes is encountered, and
+    BadRequest on malformed input.
+    """
+
+    chunks = _read_chunks(stream, chunk_size, max_size)
+
+    if mimetype in NDJSON_MIMETYPES:
+        items = _iterate_ndjson(chunks, max_item_size)
+    else:
+        items = _iterate_json_array(chunks, max_item_size)
+
+    for i, item in enumerate(items):
+        if max_items is not None and i >= max_items:
+            raise RequestEntityTooLarge(f"The payload exceeds {max_items} items")
+
+        yield item
+
+def _read_chunks(stream, chunk_size, max_size):
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    size = 0
+
+    while chunk := stream.read(chunk_size):
+        size += len(chunk)
+
+        if max_size is not None and size > max_size:
+            raise RequestEntityTooLarge(f"The payload exceeds {max_size} bytes")
+
+        try:
+            yield decoder.decode(chunk)
+        except UnicodeDecodeError:
+            raise BadRequest("The payload is not valid UTF-8")
+
+    try:
+        yield decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        raise BadRequest("The payload is not valid UTF-8")
+
+def _iterate_ndjson(chunks, max_item_size):
+    buf = ""
+
+    for chunk in chunks:
+        buf += chunk
+        lines = buf.split("\n")
+        buf = lines.pop()
+
+        if len(buf) > max_item_size:
+            raise RequestEntityTooLarge(f"A payload item exceeds {max_item_size} characters")
+
+        for line in lines:
+            if item := _parse_ndjson_line(line, max_item_size):
+                yield item[0]
+
+    if item := _parse_ndjson_line(buf, max_item_size):
+        yield item[0]
+
+def _parse_ndjson_line(line, max_item_size):
+
+    """ Return the item on `line` as a 1-tuple, or an empty tuple for blank
+    lines.
+    """
+
+    if not line.strip():
+        return ()
+    elif len(line) > max_item_size:
+        raise RequestEntityTooLarge(f"A payload item exceeds {max_item_size} characters")
+
+    try:
+        return (json.loads(line),)
+    except json.JSONDecodeError as e:
+        raise BadRequest(f"Malformed NDJSON item: {e}")
+
+def _iterate_json_array(chunks, max_item_size):
+    buf = _Buffer(chunks)
+    decoder = json.JSONDecoder()
+
+    if buf.peek() != "[":
+        raise BadRequest("Expected a JSON array")
+
+    buf.pos += 1
+
+    if buf.peek() == "]":
+        buf.pos += 1
+    else:
+        while True:
+            yield _decode_item(buf, decoder, max_item_size)
+
+            if (c := buf.peek()) == ",":
+                buf.pos += 1
+            elif c == "]":
+                buf.pos += 1
+                break
+            elif c is None:
+                raise BadRequest("Unexpected end of the JSON payload")
+            else:
+                raise BadRequest("Expected a comma or the end of the JSON array")
+
+    if buf.peek() is not None:
+        raise BadRequest("Unexpected data after the JSON array")
+
+def _decode_item(buf, decoder, max_item_size):
+    if buf.peek() is None:
+        raise BadRequest("Unexpected end of the JSON payload")
+
+    while True:
+        try:
+            (item, end) = decoder.raw_decode(buf.text, buf.pos)
+        except json.JSONDecodeError as e:
+            if buf.at_eof:
+                raise BadRequest(f"Malformed JSON payload: {e}")
+        else:
+            if end - buf.pos > max_item_size:
+                break
+
+            # A number at the end of the buffer may continue in the next
+            # chunk, only accept it once followed by a delimiter.
+
+            if buf.at_eof or not _NUMBER_CHARS_REGEX.fullmatch(buf.text, end):
+                buf.pos = end
+                return item
+
+        if len(buf.text) - buf.pos > max_item_size:
+            break
+
+        buf.fill()
+
+    raise RequestEntityTooLarge(f"A payload item exceeds {max_item_size} characters")
+
+class _Buffer:
+
+    """ A window onto a stream of text chunks, read on demand. """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.text = ""
+        self.pos = 0
+        self.at_eof = False
+
+    def fill(self):
+
+        """ Discard the text consumed so far and append the next chunk.
+        Return False at the end of the stream.
+        """
+
+        (self.text, self.pos) = (self.text[self.pos:], 0)
+
+        if (chunk := next(self.chunks, None)) is None:
+            self.at_eof = True
+            return False
+
+        self.text += chunk
+
+        return True
+
+    def peek(self):
+
+        """ Skip any whitespace and return the next character, or None at the
+        end of the stream.
+        """
+
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos].isspace():
+                self.pos += 1
+
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            elif not self.fill():
+                return None
@@ -0,0 +1,132 @@
+
+""" Timing of request phases, reported on the Server-Timing response header
+and in request log entries.
+"""
+
+import contextlib
+import time
+
+import flask as fl
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from pyvoog.configloader import config
+
+_sql_timing_installed = False
+
+def track_server_timing(app):
+
+    """ Call with an application instance to time the phases of every
+    request if the `server_timing` configuration value is true. The phases
+    are reported on the `Server-Timing` response header and are included in
+    request log entries:
+
+    - routing - From receiving the request until the URL has been matched.
+    - auth - Verifying the JWT in `authenticate`.
+    - payload - Loading the payload in `permit_attributes`.
+    - sql - Executing SQL statements.
+    - validation - Validating model objects.
+    - encode - Encoding the response in `json_endpoint`.
+    - total - From receiving the request until the response is finalized.
+
+    Further phases may be timed by `timed`. Note that phases may overlap,
+    e.g. validations may execute SQL.
+    """
+
+    if not config.get("server_timing"):
+        return
+
+    def start_timing():
+        fl.g.timings = {}
+        fl.g.sql_time = 0
+        fl.g.sql_queries = 0
+
+        if (received_at := fl.request.environ.get("pyvoog.received_at")) is not None:
+            fl.g.timings["routing"] = time.perf_counter() - received_at
+
+    def add_server_timing_header(response):
+        if (timings := get_timings()) is not None:
+            response.headers["Server-Timing"] = ", ".join(
+                f"{phase};dur={duration * 1000:.1f}" for phase, duration in timings.items()
+            )
+
+        return response
+
+    install_sql_timing()
+
+    app.before_request(start_timing)
+    app.after_request(add_server_timing_header)
+
+@contextlib.contextmanager
+def timed(phase):
+
+    """ A context manager (also usable as a decorator) adding the time spent
+    within to `phase` of the current request, if the request is being timed.
+    """
+
+    if not fl.has_request_context() or "timings" not in fl.g:
+        yield
+        return
+
+    started_at = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        timings = fl.g.timings
+        timings[phase] = timings.get(phase, 0) + time.perf_counter() - started_at
+
+def get_timings():
+
+    """ Return a dict of the phases of the current request mapped to their
+    durations in seconds, including SQL execution and the total time
+    elapsed so far. Return None if the request is not being timed.
+    """
+
+    if not fl.has_request_context() or (timings := fl.g.get("timings")) is None:
+        return None
+
+    timings = timings | {"sql": fl.g.sql_time}
+
+    if (received_at := fl.request.environ.get("pyvoog.received_at")) is not None:
+        timings["total"] = time.perf_counter() - received_at
+
+    return timings
+
+def install_sql_timing():
+
+    """ Install Engine event listeners accumulating the time spent executing
+    SQL into the `sql_time` and `sql_queries` attributes of `flask.g`, where
+    these have been initialized.
+    """
+
+    global _sql_timing_installed
+
+    if _sql_timing_installed:
+        return
+
+    def before_cursor_execute(conn, *args):
+        conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+    def after_cursor_execute(conn, *args):
+        elapsed = time.perf_counter() - conn.info["query_started_at"].pop()
+
+        if fl.has_app_context() and "sql_time" in fl.g:
+            fl.g.sql_time += elapsed
+            fl.g.sql_queries += 1
+
+    def handle_error(context):
+
+        # `after_cursor_execute` is not invoked for failed statements,
+        # discard their start times, as not to pile these up on pooled
+        # connections.
+
+        if (conn := context.connection) is not None and conn.info.get("query_started_at"):
+            conn.info["query_started_at"].pop()
+
+    event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(Engine, "handle_error", handle_error)
+
+    _sql_timing_installed = True
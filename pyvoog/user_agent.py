@@ -1,6 +1,31 @@
+import threading
+
 import requests
 
+from concurrent.futures import ThreadPoolExecutor, wait
+from http.cookiejar import DefaultCookiePolicy
+
 from attrs import define, field
+from requests.adapters import HTTPAdapter
+from requests.exceptions import Timeout
+from urllib3.util import Retry
+
+from pyvoog.circuit_breaker import CircuitBreaker
+from pyvoog.deadline import get_remaining_time, min_timeout
+from pyvoog.http_cache import CacheEntry, CacheStore, get_cache_key
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def discard_shared_sessions():
+
+    """ Forget the Sessions shared by UserAgents. Call in a forked child
+    process as not to share pooled connections with the parent. Existing
+    UserAgent instances keep using their current Session.
+    """
+
+    with _sessions_lock:
+        _sessions.clear()
 
 @define
 class UserAgent:
@@ -10,12 +35,50 @@ class UserAgent:
     Authorization header may be added as shortcuts. All other arguments to
     `request` (or rather its wrappers) may be set on the instance by
     `default_rq_args`.
+
+    Requests are made via a persistent Requests Session, keeping connections
+    to upstream hosts alive. Sessions are shared by all instances with the
+    same pool configuration and never store cookies, as not to leak state
+    across instances. Pooling and retries are configured by the following
+    attributes:
+
+    - pool_connections - The number of hosts to keep connection pools for.
+    - pool_maxsize - The maximum number of idle connections kept per host.
+    - pool_sizes - A dict of per-host overrides of `pool_maxsize`.
+    - max_retries - The number of times to retry idempotent requests
+      failing to connect or responding with HTTP/502-504, 0 by default.
+    - retry_backoff - The backoff factor between retries, in seconds.
+
+    GET responses are cached if a CacheStore (e.g. an LRUCacheStore) is
+    passed as `cache`. Fresh responses (as per Cache-Control or Expires) are
+    served from the cache, stale responses carrying an ETag or Last-Modified
+    are revalidated by a conditional request. The cache key includes the
+    Authorization header.
+
+    If a CircuitBreaker is passed as `circuit_breaker`, requests to hosts
+    whose circuit is open fail immediately with a CircuitOpenError. Errors
+    raised by Requests and HTTP/5xx responses count as failures.
+
+    Within a request with a deadline (see `pyvoog.deadline`), the time
+    remaining until the deadline caps the timeout of every request. Once the
+    deadline has passed, requests fail immediately with a Requests Timeout.
     """
 
+    DEFAULT_MAX_CONCURRENCY = 8
+    RETRY_STATUSES = (502, 503, 504)
+
     default_rq_args: dict = {}
     headers: dict = {}
     jwt: str = None
     user_agent: str = None
+    pool_connections: int = 10
+    pool_maxsize: int = 10
+    pool_sizes: dict = {}
+    max_retries: int = 0
+    retry_backoff: float = 0.1
+    cache: CacheStore = None
+    circuit_breaker: CircuitBreaker = None
+    _session: requests.Session = field(init=False, default=None)
 
     def __attrs_post_init__(self):
         if self.user_agent:
@@ -23,12 +86,230 @@ class UserAgent:
         if self.jwt:
             self.headers = self.headers | {"Authorization": f"Bearer {self.jwt}"}
 
+        self._session = self._get_shared_session()
+
     def __getattr__(self, name):
         def make_request(*args, headers={}, **kwargs):
-            method = getattr(requests, name)
+            method = self._get_session_method(name)
             headers = self.headers | headers
-            extra_rq_kwargs = self.default_rq_args | kwargs
+            extra_rq_kwargs = self._apply_deadline(
+                self._get_url(name, args, kwargs), self.default_rq_args | kwargs
+            )
+
+            if name == "get" and self.cache is not None and not extra_rq_kwargs.get("stream"):
+                return self._make_cached_request(method, *args, headers=headers, **extra_rq_kwargs)
 
             return method(*args, headers=headers, **extra_rq_kwargs)
 
         return make_request
+
+    def get_pool_stats(self):
+
+        """ Return a dict of connection pool statistics keyed by upstream
+        origin: the maximum size of the pool, the number of idle connections
+        and the total numbers of connections created and requests made.
+        """
+
+        stats = {}
+
+        for adapter in set(self._session.adapters.values()):
+            pools = adapter.poolmanager.pools
+
+            for key in pools.keys():
+                pool = pools.get(key)
+
+                if pool is None or pool.pool is None:
+                    continue
+
+                stats[f"{key.key_scheme}://{key.key_host}:{key.key_port}"] = dict(
+                    maxsize=pool.pool.maxsize,
+                    idle=sum(1 for conn in list(pool.pool.queue) if conn is not None),
+                    connections_created=pool.num_connections,
+                    requests=pool.num_requests,
+                )
+
+        return stats
+
+    def gather(
+        self, calls, max_concurrency=DEFAULT_MAX_CONCURRENCY, timeout=None, deadline=None,
+        return_exceptions=False
+    ):
+
+        """ Make several requests concurrently on a bounded thread pool and
+        return the responses in the order of `calls`. Every call is a tuple of
+        the method name (e.g. "get"), the URL and an optional dict of keyword
+        arguments to the request:
+
+            (user_response, stats_response) = ua.gather([
+                ("get", f"{base_url}/user"),
+                ("get", f"{base_url}/stats", dict(params=dict(days=7))),
+            ])
+
+        - max_concurrency - The maximum number of requests in flight.
+        - timeout - The default timeout of an individual request.
+        - deadline - The overall time budget in seconds. Requests not
+          completed by the deadline fail with a Requests Timeout exception.
+        - return_exceptions - If false, the first error (in the order of
+          `calls`) is raised once all requests have completed, to be handled
+          e.g. by `handle_upstream_errors`. If true, errors are returned in
+          place of responses.
+        """
+
+        if not calls:
+            return []
+
+        # Worker threads have no access to the request context, determine the
+        # budget of requests up front.
+
+        remaining = get_remaining_time()
+        deadline = min_timeout(deadline, remaining)
+        timeout = min_timeout(timeout, remaining)
+        futures = [None] * len(calls)
+
+        if deadline is None or deadline > 0:
+            executor = ThreadPoolExecutor(
+                max_workers=min(max_concurrency, len(calls)), thread_name_prefix="UserAgent"
+            )
+
+            try:
+                futures = [executor.submit(self._make_call, timeout, *call) for call in calls]
+                wait(futures, timeout=deadline)
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+        results = [self._get_call_result(future, call) for future, call in zip(futures, calls)]
+
+        if not return_exceptions:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+
+        return results
+
+    def _get_session_method(self, name):
+        method = getattr(self._session, name)
+
+        # Unlike `requests.get`, `Session.get` does not accept `params` as a
+        # positional argument.
+
+        if name == "get":
+            get = method
+            method = lambda url, params=None, **kwargs: get(url, params=params, **kwargs)
+
+        if self.circuit_breaker is not None:
+            return self._guard_with_circuit_breaker(name, method)
+
+        return method
+
+    def _guard_with_circuit_breaker(self, name, method):
+        def guarded(*args, **kwargs):
+            url = self._get_url(name, args, kwargs)
+            return self.circuit_breaker.call(url, method, *args, **kwargs)
+
+        return guarded
+
+    @staticmethod
+    def _get_url(name, args, kwargs):
+        return kwargs.get("url") or args[1 if name == "request" else 0]
+
+    def _apply_deadline(self, url, rq_kwargs):
+        if (remaining := get_remaining_time()) is None:
+            return rq_kwargs
+        elif remaining <= 0:
+            raise self._make_deadline_error(url)
+
+        timeout = rq_kwargs.get("timeout")
+
+        if isinstance(timeout, tuple):
+            timeout = tuple(min_timeout(t, remaining) for t in timeout)
+        else:
+            timeout = min_timeout(timeout, remaining)
+
+        return rq_kwargs | {"timeout": timeout}
+
+    @staticmethod
+    def _make_deadline_error(url):
+        return Timeout(f"Deadline exceeded requesting {url}", request=requests.Request(url=url))
+
+    def _get_shared_session(self):
+        key = (
+            self.pool_connections,
+            self.pool_maxsize,
+            tuple(sorted(self.pool_sizes.items())),
+            self.max_retries,
+            self.retry_backoff,
+        )
+
+        with _sessions_lock:
+            if key not in _sessions:
+                _sessions[key] = self._make_session()
+
+            return _sessions[key]
+
+    def _make_session(self):
+        session = requests.Session()
+
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+        for prefix in ("http://", "https://"):
+            session.mount(prefix, self._make_adapter(self.pool_maxsize))
+
+            for host, maxsize in self.pool_sizes.items():
+                session.mount(f"{prefix}{host}", self._make_adapter(maxsize))
+
+        return session
+
+    def _make_adapter(self, pool_maxsize):
+        # Read errors are not retried, as not to turn read timeouts into
+        # MaxRetryErrors, surfaced by Requests as ConnectionErrors.
+
+        retry = Retry(
+            total=self.max_retries,
+            read=False,
+            backoff_factor=self.retry_backoff,
+            status_forcelist=self.RETRY_STATUSES,
+            raise_on_status=False,
+        )
+
+        return HTTPAdapter(
+            pool_connections=self.pool_connections, pool_maxsize=pool_maxsize, max_retries=retry
+        )
+
+    def _make_cached_request(self, method, url, params=None, *, headers, **kwargs):
+        full_url = requests.Request("GET", url, params=params).prepare().url
+        key = get_cache_key(full_url, headers)
+        entry = self.cache.get(key)
+
+        if entry is not None and not entry.matches(headers):
+            entry = None
+
+        if entry is not None and entry.is_fresh:
+            return entry.to_response()
+
+        conditional_headers = entry.validators if entry is not None else {}
+        response = method(full_url, headers=(conditional_headers | headers), **kwargs)
+
+        if entry is not None and response.status_code == 304:
+            entry = entry.refreshed(response.headers)
+            self.cache.set(key, entry)
+
+            return entry.to_response()
+
+        if (new_entry := CacheEntry.from_response(response, headers)) is not None:
+            self.cache.set(key, new_entry)
+        elif entry is not None:
+            self.cache.delete(key)
+
+        return response
+
+    def _make_call(self, timeout, method, url, kwargs={}):
+        if timeout is not None:
+            kwargs = {"timeout": timeout} | kwargs
+
+        return getattr(self, method)(url, **kwargs)
+
+    def _get_call_result(self, future, call):
+        if future is None or not future.done() or future.cancelled():
+            return self._make_deadline_error(call[1])
+
+        return future.exception() or future.result()
@@ -1,5 +1,6 @@
 import importlib
 import inspect
+import re
 
 class AllowException:
 
@@ -60,6 +61,17 @@ def make_namespace_importer(module_template, subclass_of, return_class=False):
 
     return import_by_code
 
+def format_timestamp(d):
+
+    """ Format a datetime in ISO 8601, denoting UTC by the `Z` suffix.
+    Naive datetimes are formatted without an offset.
+    """
+
+    if d.tzinfo:
+        return re.sub(r"\+00:00$", "Z", d.isoformat())
+
+    return d.isoformat()
+
 def make_repr(obj):
 
     """ Generate an informative repr for `obj`. Consider using attrs, as it
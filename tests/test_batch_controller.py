@@ -0,0 +1,82 @@
+import time
+import unittest
+
+import flask as fl
+import jwt
+
+from pyvoog.app import Application
+from pyvoog.load_shedding import shed_load
+from pyvoog.router import Router
+
+JWT_SECRET = "batch-test-secret-batch-test-secret"
+
+class BatchControllerLoadSheddingTestCase(unittest.TestCase):
+
+    """ Batches run under load shedding: sub-requests must neither compete
+    with the batch request for a concurrency slot nor be shed for its
+    queue time.
+    """
+
+    def setUp(self):
+        self.app = Application("batch_test")
+        self.seen_headers = []
+
+        with self.app.app_context():
+            Router("controllers", batch_path="batch", batch_jwt_secret=JWT_SECRET).route([])
+
+        shed_load(self.app, max_queue_time=1, max_concurrent_requests=1)
+
+        @self.app.route("/ping")
+        def ping():
+            self.seen_headers.append(dict(fl.request.headers))
+            return dict(pong=True)
+
+        self.client = self.app.test_client()
+        self.headers = {
+            "Authorization": f"Bearer {jwt.encode({'exp': time.time() + 60}, JWT_SECRET)}",
+            "X-Request-Start": f"t={int(time.time() * 1000)}",
+        }
+
+    def test_sub_requests_are_not_shed(self):
+        for concurrent in (False, True):
+            res = self.client.post("/batch", headers=self.headers, json=dict(
+                requests=[dict(path="/ping")] * 3,
+                concurrent=concurrent,
+            ))
+
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(
+                [r["status"] for r in res.json["responses"]], [200] * 3
+            )
+
+    def test_sub_requests_are_not_shed_for_own_queue_headers(self):
+        stale_start = f"t={int((time.time() - 60) * 1000)}"
+        res = self.client.post("/batch", headers=self.headers, json=dict(
+            requests=[dict(path="/ping", headers={"X-Request-Start": stale_start})],
+        ))
+
+        self.assertEqual(res.json["responses"][0]["status"], 200)
+
+    def test_slot_is_released_after_batch(self):
+        self.client.post("/batch", headers=self.headers, json=dict(
+            requests=[dict(path="/ping")],
+        ))
+
+        self.assertEqual(self.client.get("/ping").status_code, 200)
+
+    def test_sub_requests_negotiate_uncompressed_json(self):
+        res = self.client.post("/batch", headers=self.headers, json=dict(requests=[dict(
+            path="/ping",
+            headers={"accept-encoding": "gzip", "accept": "application/msgpack"},
+        )]))
+
+        sub_response = res.json["responses"][0]
+        headers = {k.lower(): v for (k, v) in self.seen_headers[0].items()}
+
+        self.assertEqual(sub_response["body"], dict(pong=True))
+        self.assertNotIn("Content-Encoding", sub_response["headers"])
+        self.assertNotIn("accept-encoding", headers)
+        self.assertEqual(headers["accept"], "application/json")
+
+if __name__ == "__main__":
+    unittest.main()